@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Benchmarks the API clients and minectl commands against simulated miners (see simulator.py)
+# Example: bench.py --ethminer 500 --nbminer 100 --latency 20 --jitter 10 --failure-rate 0.01
+
+import sys
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchDir, "..", "src"))
+
+from pyethminer import EthminerApi, NBMinerApi, AsyncEthminerApi
+from pyethminer import minectl
+from simulator import raiseFileLimit
+
+def percentile(sortedValues, p):
+    if not sortedValues:
+        return float("nan")
+    return sortedValues[min(len(sortedValues) - 1, int(round(p / 100 * (len(sortedValues) - 1))))]
+
+def report(name, latencies, failures = 0):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print("{:<34} n={:<6} p50 {:8.2f} ms  p90 {:8.2f} ms  p99 {:8.2f} ms  max {:8.2f} ms  failed {}".format(
+        name, len(latencies), percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), latencies[-1] if latencies else float("nan"), failures))
+
+def timeCalls(func, count):
+    latencies = []
+    failures = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            func()
+        except (OSError, RuntimeError):
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return (latencies, failures)
+
+def startSimulator(options):
+    args = [sys.executable, os.path.join(benchDir, "simulator.py"),
+        "--ethminer", str(options.ethminer), "--nbminer", str(options.nbminer), "--gpus", str(options.gpus),
+        "--latency", str(options.latency), "--jitter", str(options.jitter), "--failure-rate", str(options.failure_rate),
+        "--payload", str(options.payload)]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    ports = json.loads(process.stdout.readline())
+    return (process, ports)
+
+def benchEthminer(port, count):
+    api = EthminerApi()
+
+    # Simulated failures can close the connection, reconnecting is counted as part of the next call like minectl does
+    def call(method, *args):
+        if not api.connected:
+            api.connect("127.0.0.1", port)
+        return getattr(api, method)(*args)
+
+    for name, method, args in (
+            ("EthminerApi.ping", "ping", ()),
+            ("EthminerApi.getStats", "getStats", ()),
+            ("EthminerApi.getDetailedStats", "getDetailedStats", ()),
+            ("EthminerApi.getPools", "getPools", ()),
+            ("EthminerApi.pauseGpu(-1)", "pauseGpu", (-1, False))):
+        report(name, *timeCalls(lambda: call(method, *args), count))
+
+    api.disconnect()
+
+def benchNBMiner(port, count):
+    api = NBMinerApi()
+    api.connect("http://127.0.0.1:{}".format(port))
+    report("NBMinerApi.getStats", *timeCalls(api.getStats, count))
+    api.disconnect()
+
+def benchAsyncFleet(ports, rounds):
+    async def run():
+        apis = [AsyncEthminerApi() for _ in ports]
+        await asyncio.gather(*[api.connect("127.0.0.1", port) for api, port in zip(apis, ports)], return_exceptions=True)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            results = await asyncio.gather(*[api.getStats() for api in apis if api.connected], return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+        for api in apis:
+            api.disconnect()
+
+        failures = sum(1 for result in results if isinstance(result, BaseException))
+        return (elapsed, failures)
+
+    elapsed, failures = asyncio.get_event_loop().run_until_complete(run())
+    print("{:<34} {} rigs x {} rounds in {:.2f} s, {:.0f} rigs/s, {} failed in last round".format("AsyncEthminerApi fleet getStats", len(ports), rounds, elapsed, len(ports) * rounds / elapsed, failures))
+
+def writeConfig(ports):
+    config = tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False)
+    with config:
+        config.write("max_workers = 64\n\n")
+        for i, port in enumerate(ports["ethminer"]):
+            config.write("[[miners]]\nname = \"eth{}\"\nhost = \"127.0.0.1\"\nport = {}\ntags = {{ rack = \"rack-{}\" }}\n\n".format(i, port, i // 20))
+        for i, port in enumerate(ports["nbminer"]):
+            config.write("[[miners]]\nname = \"nb{}\"\napi_type = \"nbminer\"\nurl = \"http://127.0.0.1:{}\"\ntags = {{ rack = \"rack-nb\" }}\n\n".format(i, port))
+    return config.name
+
+def runMinectl(argv):
+    minectl.miners.clear()
+    minectl.minerOrder.clear()
+    exitCode = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            minectl.runCommand(["minectl"] + argv)
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    for miner in minectl.miners.values():
+        if miner["api"]:
+            miner["api"].disconnect()
+    if exitCode != 0:
+        raise RuntimeError("minectl {} exited with code {}".format(" ".join(argv), exitCode))
+
+def benchMinectl(configFile, rigs, count):
+    minectl.configFile = configFile
+    for argv in (["status"], ["status", "rack=rack-0"], ["pools"], ["pause", "all", "0"], ["resume", "all", "0"], ["pool", "0"], ["lhr", "0"]):
+        latencies, failures = timeCalls(lambda: runMinectl(argv), count)
+        report("minectl {}".format(" ".join(argv)), latencies, failures)
+        if latencies and "rack=rack-0" not in argv:
+            print("{:<34} {:.0f} rigs/s".format("", rigs / (sum(latencies) / len(latencies))))
+
+def main():
+    parser = argparse.ArgumentParser(description="pyethminer benchmarks against simulated miners")
+    parser.add_argument("--ethminer", type=int, default=100, help="number of simulated ethminer rigs")
+    parser.add_argument("--nbminer", type=int, default=20, help="number of simulated NBMiner rigs")
+    parser.add_argument("--gpus", type=int, default=8, help="GPUs per rig")
+    parser.add_argument("--latency", type=float, default=1, help="simulated response latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="simulated latency jitter in ms")
+    parser.add_argument("--failure-rate", type=float, default=0, help="fraction of simulated requests that fail")
+    parser.add_argument("--payload", type=int, default=0, help="extra bytes in detailed/NBMiner status responses")
+    parser.add_argument("--calls", type=int, default=200, help="calls per single-miner benchmark")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds of fleet-wide collection")
+    options = parser.parse_args()
+
+    raiseFileLimit()
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="minectl-bench-")
+    minectl.daemonSocket = os.path.join(os.environ["XDG_CACHE_HOME"], "nonexistent.sock")
+
+    process, ports = startSimulator(options)
+    configFile = writeConfig(ports)
+    try:
+        print("Simulating {} ethminer and {} NBMiner rigs, {} GPUs, {} ms +/- {} ms latency, {:.1%} failures".format(
+            options.ethminer, options.nbminer, options.gpus, options.latency, options.jitter, options.failure_rate))
+
+        if ports["ethminer"]:
+            benchEthminer(ports["ethminer"][0], options.calls)
+        if ports["nbminer"]:
+            benchNBMiner(ports["nbminer"][0], options.calls)
+        if ports["ethminer"]:
+            benchAsyncFleet(ports["ethminer"], options.rounds)
+
+        benchMinectl(configFile, options.ethminer + options.nbminer, options.rounds)
+    finally:
+        process.terminate()
+        os.unlink(configFile)
+
+if __name__ == "__main__":
+    main()
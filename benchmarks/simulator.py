@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# Simulated ethminer (newline-delimited JSON-RPC) and NBMiner (HTTP /api/v1/status) endpoints for benchmarking
+# Prints {"ethminer": [ports], "nbminer": [ports]} as one JSON line once listening, then serves until killed
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+class SimulatedRig:
+    def __init__(self, gpuCount, latency, jitter, failureRate, payloadSize, rng):
+        self.gpuCount = gpuCount
+        self.latency = latency
+        self.jitter = jitter
+        self.failureRate = failureRate
+        self.payloadSize = payloadSize
+        self.rng = rng
+        self.startTime = time.time()
+        self.activePool = 0
+        self.paused = [False] * gpuCount
+        self.lhrTune = [0] * gpuCount
+
+    def delay(self):
+        return max(0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    # One of None (answer normally), "error", "drop" (never answer) or "close" (close the connection)
+    def failure(self):
+        if self.failureRate <= 0 or self.rng.random() >= self.failureRate:
+            return None
+        return self.rng.choice(("error", "drop", "close"))
+
+    def hashrates(self):
+        return [0 if paused else 30000 + self.rng.randint(-500, 500) for paused in self.paused]
+
+    def getStat1(self):
+        hashrates = self.hashrates()
+        tempFan = []
+        for i in range(self.gpuCount):
+            tempFan += [str(60 + i % 10), str(50 + i % 20)]
+
+        return [
+            "ethminer-0.19.0-simulated",
+            str(int((time.time() - self.startTime) / 60)),
+            "{};{};{}".format(sum(hashrates), 1000, 2),
+            ";".join(str(h) for h in hashrates),
+            "0;0;0;0",
+            ";".join("off" for _ in range(self.gpuCount)),
+            ";".join(tempFan),
+            "pool{}.example.com:4444".format(self.activePool),
+            "1;{}".format(self.activePool)
+        ]
+
+    def getStatDetail(self):
+        return {
+            "host": {"name": "sim", "runtime": int(time.time() - self.startTime), "version": "ethminer-0.19.0-simulated"},
+            "connection": {"connected": True, "switches": 1, "uri": "stratum+tcp://pool{}.example.com:4444".format(self.activePool)},
+            "mining": {"hashrate": hex(sum(self.hashrates()) * 1000), "shares": [1000, 2, 1, 5], "difficulty": 4.0, "epoch": 400},
+            "devices": [{
+                "_index": i,
+                "_mode": "CUDA",
+                "hardware": {"name": "GPU{}".format(i), "pci": "01:00.{}".format(i), "sensors": [60, 50, 220], "type": "GPU"},
+                "mining": {"hashrate": hex(h * 1000), "pause_reason": "api" if self.paused[i] else None, "paused": self.paused[i], "segment": ["0x0", "0x1"], "shares": [100, 0, 0, 3]}
+            } for i, h in enumerate(self.hashrates())],
+            "padding": "x" * self.payloadSize
+        }
+
+    def getConnections(self):
+        return [{"index": i, "active": i == self.activePool, "scheme": "stratum+tcp", "host": "pool{}.example.com".format(i), "port": 4444} for i in range(3)]
+
+    def handleRpc(self, request):
+        method = request.get("method")
+        params = request.get("params") or {}
+
+        if method == "miner_getstat1":
+            return self.getStat1()
+        elif method == "miner_getstatdetail":
+            return self.getStatDetail()
+        elif method == "miner_ping":
+            return "pong"
+        elif method == "miner_getconnections":
+            return self.getConnections()
+        elif method == "miner_setactiveconnection":
+            self.activePool = params["index"]
+            return True
+        elif method == "miner_pausegpu":
+            self.paused[params["index"]] = params["pause"]
+            return True
+        elif method == "miner_setlhrtune":
+            self.lhrTune[params["index"]] = params["tune"]
+            return True
+        elif method in ("api_authorize", "miner_restart", "miner_shuffle", "miner_setverbosity"):
+            return True
+        elif method == "miner_getscramblerinfo":
+            return {"noncescrambler": 0, "segmentwidth": 32}
+        elif method == "miner_setscramblerinfo":
+            return True
+
+        raise KeyError(method)
+
+    def nbminerStatus(self):
+        devices = [{
+            "id": i, "info": "GeForce RTX 3080", "pci_bus_id": i + 1,
+            "accepted_shares": 100, "rejected_shares": 0, "invalid_shares": 0,
+            "hashrate_raw": h * 1000, "core_clock": 1500, "mem_clock": 9500,
+            "core_utilization": 100, "mem_utilization": 90, "lhr": 72.5,
+            "temperature": 60, "memTemperature": 90, "fan": 70, "power": 220
+        } for i, h in enumerate(self.hashrates())]
+
+        return {
+            "version": "42.2-simulated",
+            "start_time": int(self.startTime),
+            "miner": {"total_hashrate_raw": sum(d["hashrate_raw"] for d in devices), "devices": devices},
+            "stratum": {"accepted_shares": 1000, "rejected_shares": 2, "invalid_shares": 1},
+            "padding": "x" * self.payloadSize
+        }
+
+async def respondRpc(rig, writer, request):
+    await asyncio.sleep(rig.delay())
+
+    failure = rig.failure()
+    if failure == "drop":
+        return
+    elif failure == "close":
+        writer.close()
+        return
+    elif failure == "error":
+        response = {"id": request.get("id"), "jsonrpc": "2.0", "error": {"code": -32000, "message": "Simulated failure"}}
+    else:
+        try:
+            response = {"id": request.get("id"), "jsonrpc": "2.0", "result": rig.handleRpc(request)}
+        except (KeyError, IndexError, TypeError):
+            response = {"id": request.get("id"), "jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}}
+
+    if not writer.is_closing():
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+
+async def handleEthminer(rig, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            # Requests are answered concurrently so pipelined requests may complete out of order
+            asyncio.ensure_future(respondRpc(rig, writer, json.loads(line)))
+    except (OSError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def handleNBMiner(rig, reader, writer):
+    try:
+        while True:
+            requestLine = await reader.readline()
+            if not requestLine:
+                break
+
+            keepAlive = requestLine.rstrip().endswith(b"HTTP/1.1")
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if line.lower().startswith(b"connection:"):
+                    keepAlive = b"close" not in line.lower()
+
+            await asyncio.sleep(rig.delay())
+
+            failure = rig.failure()
+            if failure in ("drop", "close"):
+                break
+
+            if failure == "error":
+                status = "500 Internal Server Error"
+                body = b"{}"
+            elif requestLine.split()[1].endswith(b"/api/v1/status"):
+                status = "200 OK"
+                body = json.dumps(rig.nbminerStatus()).encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"{}"
+
+            headers = "HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n".format(status, len(body), "" if keepAlive else "Connection: close\r\n")
+            writer.write(headers.encode("ascii") + body)
+            await writer.drain()
+
+            if not keepAlive:
+                break
+    except (OSError, ValueError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+async def startServers(options):
+    rng = random.Random(options.seed)
+    ports = {"ethminer": [], "nbminer": []}
+    servers = []
+
+    for apiType, count, handler in (("ethminer", options.ethminer, handleEthminer), ("nbminer", options.nbminer, handleNBMiner)):
+        for _ in range(count):
+            rig = SimulatedRig(options.gpus, options.latency / 1000, options.jitter / 1000, options.failure_rate, options.payload, rng)
+            server = await asyncio.start_server(lambda reader, writer, rig=rig, handler=handler: handler(rig, reader, writer), options.host, 0)
+            servers.append(server)
+            ports[apiType].append(server.sockets[0].getsockname()[1])
+
+    return (servers, ports)
+
+def raiseFileLimit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description="Simulated ethminer and NBMiner API endpoints")
+    parser.add_argument("--ethminer", type=int, default=1, help="number of simulated ethminer rigs")
+    parser.add_argument("--nbminer", type=int, default=0, help="number of simulated NBMiner rigs")
+    parser.add_argument("--gpus", type=int, default=8, help="GPUs per rig")
+    parser.add_argument("--latency", type=float, default=1, help="response latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="latency jitter in ms (uniform +/-)")
+    parser.add_argument("--failure-rate", type=float, default=0, help="fraction of requests that fail (error, no response or closed connection)")
+    parser.add_argument("--payload", type=int, default=0, help="extra bytes of padding in detailed/NBMiner status responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(args)
+
+def main():
+    options = parseArgs()
+    raiseFileLimit()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    servers, ports = loop.run_until_complete(startServers(options))
+
+    print(json.dumps(ports), flush=True)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Measures minectl startup time against a time budget
+# Usage: startup.py [runs] [help budget ms] [status budget ms]
+
+import sys
+import os
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+srcDir = os.path.join(benchDir, "..", "src")
+
+def timeCommand(configFile, args, runs):
+    code = "import sys; from pyethminer import minectl; minectl.configFile = {!r}; sys.argv = ['minectl'] + {!r}; minectl.main()".format(configFile, args)
+    env = dict(os.environ, PYTHONPATH=srcDir, MINECTL_SOCKET=os.path.join(tempfile.gettempdir(), "minectl-bench-nonexistent.sock"))
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(times)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) >= 2 else 10
+    budgets = {
+        "help": float(sys.argv[2]) if len(sys.argv) >= 3 else 100,
+        "status": float(sys.argv[3]) if len(sys.argv) >= 4 else 200
+    }
+
+    simulator = subprocess.Popen([sys.executable, os.path.join(benchDir, "simulator.py"), "--ethminer", "1", "--gpus", "2"], stdout=subprocess.PIPE)
+    port = json.loads(simulator.stdout.readline())["ethminer"][0]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False) as config:
+        config.write("miners = [\n    {{ name = \"bench\", api_type = \"ethminer\", host = \"127.0.0.1\", port = {} }}\n]\n".format(port))
+
+    failed = False
+    try:
+        for name, args in (("help", ["help"]), ("status", ["status", "bench"])):
+            median = timeCommand(config.name, args, runs)
+            ok = median <= budgets[name]
+            failed = failed or not ok
+            print("minectl {:<14} {:7.1f} ms (budget {:.0f} ms) {}".format(" ".join(args), median, budgets[name], "ok" if ok else "OVER BUDGET"))
+    finally:
+        simulator.terminate()
+        os.unlink(config.name)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,25 @@
-from pyethminer.ethminerapi import EthminerApi
-from pyethminer.nbminerapi import NBMinerApi
\ No newline at end of file
+# Client classes are imported on first use so importing the package (or minectl) doesn't load asyncio, http.client, etc.
+import importlib
+
+lazyImports = {
+    "EthminerApi": "pyethminer.ethminerapi",
+    "NBMinerApi": "pyethminer.nbminerapi",
+    "AsyncEthminerApi": "pyethminer.asyncethminerapi",
+    "AsyncNBMinerApi": "pyethminer.asyncnbminerapi",
+    "MetricStore": "pyethminer.metricstore",
+    "MinerStats": "pyethminer.stats",
+    "DeviceStats": "pyethminer.stats"
+}
+
+__all__ = list(lazyImports)
+
+def __getattr__(name):
+    if name in lazyImports:
+        value = getattr(importlib.import_module(lazyImports[name]), name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
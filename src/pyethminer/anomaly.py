@@ -0,0 +1,184 @@
+# Streaming anomaly detection on device hashrate and temperature
+# Author: Ziah Jyothi
+
+import collections
+import math
+import time
+
+# Exponentially weighted mean and variance, updated in O(1) per sample
+class Ewma:
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = None
+        self.var = 0.0
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+        if self.mean is None:
+            self.mean = value
+            return
+
+        diff = value - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.var = (1 - self.alpha) * (self.var + diff * incr)
+
+    # Standard deviations from the mean, the deviation is at least minStd so a perfectly flat series doesn't turn every
+    # small wobble into an outlier
+    def zScore(self, value, minStd):
+        return (value - self.mean) / max(math.sqrt(self.var), minStd)
+
+class DeviceAnomalyState:
+    def __init__(self, alpha):
+        self.hashrate = Ewma(alpha)
+        self.temp = Ewma(alpha)
+        self.anomalyKind = None
+        self.anomalousSamples = 0
+        self.reported = False
+
+class MinerAnomalyState:
+    def __init__(self):
+        self.devices = []
+        self.maxDevices = 0
+        self.lostReported = False
+        self.graceUntil = 0
+        self.actions = collections.deque()
+
+# Flags devices whose hashrate dropped by more than minDrop and zThreshold deviations below its EWMA, whose hashrate is
+# zero while the baseline isn't, or whose core temperature rose by more than minRise and zThreshold deviations above its
+# EWMA. A device is only reported once it was anomalous for sustain samples in a row, and once per episode. Baselines
+# learn for warmup samples first and are frozen while a device is anomalous so they don't adapt to the fault. Devices
+# reported as paused are skipped.
+#
+# Remediation is rate limited: per miner at most one action per cooldown and maxActions per hour, across the fleet at
+# most fleetActions per hour (many miners failing at once is more likely the pool or network than the rigs). After an
+# action the miner gets graceTime to ramp back up before it is checked again.
+class AnomalyDetector:
+    def __init__(self, alpha = 0.1, zThreshold = 4, minDrop = 0.2, minRise = 5, warmup = 10, sustain = 3, cooldown = 900, maxActions = 3, fleetActions = 10, graceTime = 300):
+        self.alpha = alpha
+        self.zThreshold = zThreshold
+        self.minDrop = minDrop
+        self.minRise = minRise
+        self.warmup = warmup
+        self.sustain = sustain
+        self.cooldown = cooldown
+        self.maxActions = maxActions
+        self.fleetActions = fleetActions
+        self.graceTime = graceTime
+        self.states = {}
+        self.fleetActionTimes = collections.deque()
+
+    def getState(self, minerName):
+        state = self.states.get(minerName)
+        if state is None:
+            state = MinerAnomalyState()
+            self.states[minerName] = state
+        return state
+
+    def checkDevice(self, device, deviceState):
+        # A paused device isn't hashing on purpose, that ends its episode and its baselines wait until it is resumed
+        if device.get("paused"):
+            deviceState.anomalyKind = None
+            deviceState.anomalousSamples = 0
+            deviceState.reported = False
+            return None
+
+        hashrate = device.get("hashrate")
+        temp = device.get("core_temp")
+
+        if deviceState.hashrate.count < self.warmup:
+            if hashrate is not None:
+                deviceState.hashrate.update(hashrate)
+            if temp is not None:
+                deviceState.temp.update(temp)
+            return None
+
+        reason = None
+        if hashrate is not None:
+            baseline = deviceState.hashrate.mean
+            if hashrate == 0 and baseline > 0:
+                reason = ("hashrate", "hashrate 0 Mh/s, usually {:.2f}Mh/s".format(baseline))
+            elif hashrate < baseline * (1 - self.minDrop) and deviceState.hashrate.zScore(hashrate, baseline * 0.02) < -self.zThreshold:
+                reason = ("hashrate", "hashrate {:.2f}Mh/s, usually {:.2f}Mh/s".format(hashrate, baseline))
+        if reason is None and temp is not None and deviceState.temp.mean is not None:
+            baseline = deviceState.temp.mean
+            if temp > baseline + self.minRise and deviceState.temp.zScore(temp, 1) > self.zThreshold:
+                reason = ("temp", "core temperature {}C, usually {:.0f}C".format(temp, baseline))
+
+        # A different kind of anomaly starts a new episode
+        if reason is None or reason[0] != deviceState.anomalyKind:
+            deviceState.anomalyKind = reason and reason[0]
+            deviceState.anomalousSamples = 0
+            deviceState.reported = False
+
+        if reason is None:
+            if hashrate is not None:
+                deviceState.hashrate.update(hashrate)
+            if temp is not None:
+                deviceState.temp.update(temp)
+            return None
+
+        deviceState.anomalousSamples += 1
+        if deviceState.anomalousSamples < self.sustain or deviceState.reported:
+            return None
+
+        deviceState.reported = True
+        return reason
+
+    # Returns newly sustained anomalies as [(deviceIndex, kind, description)], deviceIndex is -1 with kind "devices" if
+    # GPUs stopped reporting
+    def update(self, minerName, stats, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+        devices = stats["devices"]
+
+        while len(state.devices) < len(devices):
+            state.devices.append(DeviceAnomalyState(self.alpha))
+
+        if now < state.graceUntil:
+            return []
+
+        anomalies = []
+        if len(devices) < state.maxDevices:
+            if not state.lostReported:
+                state.lostReported = True
+                anomalies.append((-1, "devices", "{} of {} GPUs reporting".format(len(devices), state.maxDevices)))
+        else:
+            state.lostReported = False
+            state.maxDevices = len(devices)
+
+        for i, device in enumerate(devices):
+            reason = self.checkDevice(device, state.devices[i])
+            if reason:
+                anomalies.append((i,) + reason)
+
+        return anomalies
+
+    def allowAction(self, minerName, now = None):
+        if now is None:
+            now = time.time()
+        actions = self.getState(minerName).actions
+
+        while actions and actions[0] < now - 3600:
+            actions.popleft()
+        while self.fleetActionTimes and self.fleetActionTimes[0] < now - 3600:
+            self.fleetActionTimes.popleft()
+
+        if actions and now - actions[-1] < self.cooldown:
+            return False
+        return len(actions) < self.maxActions and len(self.fleetActionTimes) < self.fleetActions
+
+    def recordAction(self, minerName, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        state.actions.append(now)
+        self.fleetActionTimes.append(now)
+        state.graceUntil = now + self.graceTime
+        for deviceState in state.devices:
+            deviceState.anomalyKind = None
+            deviceState.anomalousSamples = 0
+            deviceState.reported = False
@@ -0,0 +1,228 @@
+# Ethminer JSON-RPC API asyncio Client Library
+# Author: Ziah Jyothi
+
+import asyncio
+import time
+from pyethminer import codec
+from pyethminer.ethminerapi import EthminerApi
+
+class AsyncEthminerApi:
+    jsonApiVersion = EthminerApi.jsonApiVersion
+
+    def __init__(self):
+        self.debug = False
+        self.timeout = 1
+        self.reader = None
+        self.writer = None
+        self.readTask = None
+        self.connected = False
+        self.lastConnected = 0
+        self.nextRequestId = 0
+        self.pendingRequests = {}
+        self.topologyTtl = 60
+        self.gpuIndices = None
+        self.gpuIndicesUpdated = 0
+
+    async def connect(self, host = "localhost", port = 3333):
+        self.connected = False
+        try:
+            # miner_getstatdetail responses can be larger than the default 64 KiB line limit
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port, limit=2 ** 20), self.timeout)
+        except asyncio.TimeoutError:
+            self.onDisconnect()
+            raise TimeoutError("Timed out connecting to {}:{}".format(host, port))
+        except OSError:
+            self.onDisconnect()
+            raise
+
+        self.connected = True
+        self.invalidateTopology()
+        self.readTask = asyncio.ensure_future(self.readResponses())
+        self.onConnect()
+
+    def disconnect(self):
+        self.onDisconnect()
+
+    def onConnect(self):
+        if self.debug:
+            print("Miner connected: {}".format(self.writer.get_extra_info("peername")))
+        self.lastConnected = 0
+
+    def onDisconnect(self, error = None):
+        self.invalidateTopology()
+
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+        if self.readTask and not self.readTask.done():
+            self.readTask.cancel()
+        self.readTask = None
+
+        for future in self.pendingRequests.values():
+            if not future.done():
+                future.set_exception(error or ConnectionResetError("Miner disconnected"))
+        self.pendingRequests = {}
+
+        if self.connected:
+            self.connected = False
+
+            if self.debug:
+                print("Miner disconnected")
+
+            self.lastConnected = time.time()
+        elif self.debug:
+            print("Miner connection failed again")
+
+    # Single reader per connection, responses are handed to the waiting request by ID so several requests can be in
+    # flight at once
+    async def readResponses(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionResetError("Miner closed the connection")
+
+                response = codec.loads(line)
+                if not isinstance(response, dict):
+                    raise RuntimeError("Invalid response from miner: {!r}".format(response))
+
+                if self.debug:
+                    print("Response: {}".format(response))
+
+                future = self.pendingRequests.pop(response.get("id"), None)
+                if future is None:
+                    print("Warning: received response with unknown ID {}, ignoring".format(response.get("id")))
+                elif not future.done():
+                    future.set_result(response)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.onDisconnect(e)
+
+    async def sendRequest(self, request):
+        if not self.connected or not self.writer:
+            raise RuntimeError("Unable to send request when disconnected")
+
+        request["id"] = self.nextRequestId
+        self.nextRequestId = self.nextRequestId + 1
+
+        if self.debug:
+            print("Sending: {}".format(request))
+
+        future = asyncio.get_event_loop().create_future()
+        self.pendingRequests[request["id"]] = future
+
+        try:
+            self.writer.write(codec.encodeRequest(request))
+            await self.writer.drain()
+        except ConnectionError as e:
+            self.onDisconnect(e)
+            raise
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pendingRequests.pop(request["id"], None)
+            return None
+
+    async def authorize(self, password):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "api_authorize", "params": { "psw": password }})
+
+        EthminerApi.handleResponse(response, "Failed to authorize")
+
+    async def ping(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_ping"})
+
+        EthminerApi.handleResponse(response, "Failed to ping", "pong")
+
+    async def getStats(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_getstat1"})
+
+        EthminerApi.handleResponse(response, "Failed to get statistics", None)
+
+        stats = EthminerApi.parseResult(EthminerApi.parseStats, response["result"], "Invalid statistics")
+        self.updateTopology(len(stats["devices"]))
+
+        return stats
+
+    async def getDetailedStats(self, raw = False):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_getstatdetail"})
+
+        EthminerApi.handleResponse(response, "Failed to get detailed statistics", None)
+
+        return response["result"] if raw else EthminerApi.parseResult(EthminerApi.parseDetailedStats, response["result"], "Invalid detailed statistics")
+
+    async def restart(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_restart"})
+
+        EthminerApi.handleResponse(response, "Failed to restart miner")
+
+        self.invalidateTopology()
+
+    async def shuffleScrambler(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_shuffle"})
+
+        EthminerApi.handleResponse(response, "Failed to shuffle scramble nonce")
+
+    async def getScramblerInfo(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_getscramblerinfo"})
+
+        EthminerApi.handleResponse(response, "Failed to get scrambler info", None)
+
+        return response["result"]
+
+    async def setScramblerInfo(self, nonceScrambler, segmentWidth):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_setscramblerinfo", "params": {"noncescrambler": nonceScrambler, "segmentwidth": segmentWidth}})
+
+        EthminerApi.handleResponse(response, "Failed to set scrambler info", None)
+
+        return response["result"]
+
+    async def getPools(self):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_getconnections"})
+
+        EthminerApi.handleResponse(response, "Failed to get pools", None)
+
+        return EthminerApi.parseResult(EthminerApi.parsePools, response["result"], "Invalid pools")
+
+    async def setActivePool(self, index):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_setactiveconnection", "params": { "index": index }})
+
+        EthminerApi.handleResponse(response, "Failed to set active pool")
+
+    def updateTopology(self, gpuCount):
+        self.gpuIndices = list(range(gpuCount))
+        self.gpuIndicesUpdated = time.time()
+
+    def invalidateTopology(self):
+        self.gpuIndices = None
+        self.gpuIndicesUpdated = 0
+
+    async def getGpuIndices(self, index = -1):
+        if index != -1:
+            return [index]
+
+        if self.gpuIndices is None or time.time() - self.gpuIndicesUpdated > self.topologyTtl:
+            await self.getStats()
+
+        return self.gpuIndices
+
+    async def pauseGpu(self, index, pause = True):
+        indices = await self.getGpuIndices(index)
+
+        responses = await asyncio.gather(*[self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_pausegpu", "params": { "index": idx, "pause": pause }}) for idx in indices])
+
+        for idx, response in zip(indices, responses):
+            EthminerApi.handleResponse(response, "Failed to pause GPU {}".format(idx))
+
+    async def setVerbosity(self, verbosity):
+        response = await self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_setverbosity", "params": { "verbosity": verbosity }})
+
+        EthminerApi.handleResponse(response, "Failed to set verbosity")
+
+    async def setLhrTune(self, index, tune):
+        indices = await self.getGpuIndices(index)
+
+        responses = await asyncio.gather(*[self.sendRequest({"jsonrpc": AsyncEthminerApi.jsonApiVersion, "method": "miner_setlhrtune", "params": { "index": idx, "tune": tune}}) for idx in indices])
+
+        for idx, response in zip(indices, responses):
+            EthminerApi.handleResponse(response, "Failed to set LHR tune for GPU {}".format(idx))
@@ -0,0 +1,83 @@
+# NBMiner REST API asyncio Client Library
+# Author: Ziah Jyothi
+
+import asyncio
+from pyethminer import codec
+import urllib.parse
+from pyethminer.nbminerapi import NBMinerApi
+
+class AsyncNBMinerApi:
+    API_V1_PATH = NBMinerApi.API_V1_PATH
+
+    def __init__(self):
+        self.timeout = 1
+        self.url = None
+        self.host = None
+        self.port = None
+        self.basePath = ""
+
+    async def connect(self, url="http://localhost:22333"):
+        parsedUrl = urllib.parse.urlsplit(url)
+        if parsedUrl.scheme != "http":
+            raise RuntimeError("Unsupported NBMiner API URL scheme: {}".format(parsedUrl.scheme))
+
+        self.url = url
+        self.host = parsedUrl.hostname
+        self.port = parsedUrl.port or 80
+        self.basePath = parsedUrl.path.rstrip("/")
+
+    def disconnect(self):
+        self.url = None
+
+    async def sendRequest(self, path):
+        if not self.url:
+            raise RuntimeError("Unable to send request when disconnected")
+
+        try:
+            return await asyncio.wait_for(self.httpGet(self.basePath + NBMinerApi.API_V1_PATH + path), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out requesting {}{}{}".format(self.url, NBMinerApi.API_V1_PATH, path))
+
+    async def httpGet(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write("GET {} HTTP/1.1\r\nHost: {}:{}\r\nAccept: application/json\r\nConnection: close\r\n\r\n".format(path, self.host, self.port).encode("ascii"))
+            await writer.drain()
+
+            statusLine = await reader.readline()
+            statusParts = statusLine.decode("latin-1").split(" ", 2)
+            if len(statusParts) < 2 or not statusParts[0].startswith("HTTP/"):
+                raise RuntimeError("Invalid HTTP response from NBMiner: {}".format(statusLine))
+            if statusParts[1] != "200":
+                raise RuntimeError("NBMiner API request failed: {}".format(statusLine.decode("latin-1").strip()))
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                body = bytearray()
+                while True:
+                    chunkSize = int((await reader.readline()).split(b";")[0], 16)
+                    if chunkSize == 0:
+                        break
+                    body += await reader.readexactly(chunkSize)
+                    await reader.readline()
+                return bytes(body)
+            elif "content-length" in headers:
+                return await reader.readexactly(int(headers["content-length"]))
+            else:
+                return await reader.read()
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionResetError("NBMiner closed the connection mid-response") from e
+        finally:
+            writer.close()
+
+    async def getStats(self):
+        response = codec.loads(await self.sendRequest("/status"))
+
+        return NBMinerApi.parseStats(response)
@@ -0,0 +1,277 @@
+# Delta events from successive miner stats polls
+# Author: Ziah Jyothi
+
+import os
+import socket
+import selectors
+import threading
+import time
+from pyethminer import codec
+from pyethminer.stats import MinerStats, DeviceStats
+
+# "core_temp>80", "hashrate<100" or "device.hashrate<20" as (scope, field, op, value). Fields of MinerStats are checked on
+# the miner, other fields and fields with a "device." prefix on every device.
+def parseThreshold(spec):
+    for op in (">", "<"):
+        field, sep, value = spec.partition(op)
+        if sep:
+            break
+    else:
+        raise ValueError("Invalid threshold {}, expected FIELD>VALUE or FIELD<VALUE".format(spec))
+
+    field = field.strip()
+    scope = "miner"
+    if field.startswith("device."):
+        field = field[len("device."):]
+        scope = "device"
+    elif field not in MinerStats.fieldSet:
+        scope = "device"
+
+    if field not in (DeviceStats.fieldSet if scope == "device" else MinerStats.fieldSet):
+        raise ValueError("Unknown {} field in threshold {}".format(scope, spec))
+
+    return (scope, field, op, float(value))
+
+# Turns each poll of a miner into events describing only what changed since its previous poll:
+#   snapshot       first poll of a miner, the full stats
+#   shares         accepted/rejected/failed share increments
+#   pool           activePool or poolSwitches changed
+#   restart        counters went backwards, share counting starts over
+#   device_added / device_lost
+#   threshold      a threshold started ("crossed") or stopped ("cleared") being exceeded
+#   down / up      the miner couldn't be polled / could be polled again
+class ChangeFeed:
+    def __init__(self, thresholds = ()):
+        self.thresholds = list(thresholds)
+        self.lastStats = {}
+        self.down = set()
+        # (minerName, device index or None, threshold index) currently exceeded
+        self.exceeded = set()
+
+    def update(self, minerName, stats, now = None):
+        if now is None:
+            now = time.time()
+        events = []
+
+        def event(eventType, **fields):
+            events.append(dict(type=eventType, miner=minerName, time=round(now, 3), **fields))
+
+        if stats is None:
+            if minerName not in self.down:
+                self.down.add(minerName)
+                event("down")
+            return events
+
+        if minerName in self.down:
+            self.down.discard(minerName)
+            event("up")
+
+        old = self.lastStats.get(minerName)
+        self.lastStats[minerName] = stats
+
+        if old is None:
+            event("snapshot", stats=stats.toDict())
+        else:
+            counters = ("sharesAccepted", "sharesRejected", "sharesFailed")
+            increments = {field: (stats.get(field, 0) - old.get(field, 0)) for field in counters}
+            if any(increment < 0 for increment in increments.values()) or stats.get("runtime", 0) < old.get("runtime", 0):
+                event("restart", runtime=stats.get("runtime"))
+            elif any(increments.values()):
+                event("shares", **{field: increment for field, increment in increments.items() if increment})
+
+            if stats.get("activePool") != old.get("activePool") or stats.get("poolSwitches") != old.get("poolSwitches"):
+                event("pool", previous=old.get("activePool"), current=stats.get("activePool"), switches=stats.get("poolSwitches"))
+
+            for i in range(len(old.devices), len(stats.devices)):
+                event("device_added", device=i, stats=stats.devices[i].toDict())
+            for i in range(len(stats.devices), len(old.devices)):
+                event("device_lost", device=i)
+
+        for thresholdIndex, (scope, field, op, limit) in enumerate(self.thresholds):
+            if scope == "miner":
+                targets = [(None, stats)]
+            else:
+                targets = list(enumerate(stats.devices))
+
+            for deviceIndex, target in targets:
+                value = target.get(field)
+                if value is None:
+                    continue
+
+                key = (minerName, deviceIndex, thresholdIndex)
+                exceeded = value > limit if op == ">" else value < limit
+                if exceeded == (key in self.exceeded):
+                    continue
+
+                if exceeded:
+                    self.exceeded.add(key)
+                else:
+                    self.exceeded.discard(key)
+
+                fields = {"field": field, "value": value, "threshold": "{}{}".format(op, limit), "state": "crossed" if exceeded else "cleared"}
+                if deviceIndex is not None:
+                    fields["device"] = deviceIndex
+                event("threshold", **fields)
+
+        return events
+
+    def snapshot(self, now = None):
+        if now is None:
+            now = time.time()
+        return [{"type": "snapshot", "miner": minerName, "time": round(now, 3), "stats": stats.toDict()} for minerName, stats in list(self.lastStats.items())]
+
+def encodeEvent(event):
+    return codec.dumps(event) + b"\n"
+
+# Serves the events of feed as NDJSON to every client connected to a Unix socket. New clients get a snapshot first so
+# they can apply the deltas that follow. The server feeds the polls into feed itself, under the same lock the snapshot
+# for a new client is taken with, so a client sees each batch either in its snapshot or as events, never both or
+# neither. Events are queued per client and sent by the server's thread, a client whose queue grows past maxBuffer bytes
+# can't keep up and is dropped instead of stalling the feed.
+class FeedServer:
+    def __init__(self, socketPath, feed, maxBuffer = 1 << 20):
+        self.socketPath = socketPath
+        self.feed = feed
+        self.maxBuffer = maxBuffer
+        # socket -> bytes waiting to be sent, None once the client is to be dropped
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.sock = None
+        self.selector = None
+        self.wakeupRecv = None
+        self.wakeupSend = None
+        self.thread = None
+        self.closing = False
+
+    def start(self):
+        try:
+            os.unlink(self.socketPath)
+        except FileNotFoundError:
+            pass
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socketPath)
+        self.sock.listen(16)
+        self.sock.setblocking(False)
+
+        self.wakeupRecv, self.wakeupSend = socket.socketpair()
+        self.wakeupRecv.setblocking(False)
+        self.wakeupSend.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self.wakeupRecv, selectors.EVENT_READ)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Updates the feed with a batch of (minerName, stats) polls and queues the events for every client
+    def update(self, results):
+        with self.lock:
+            events = []
+            for minerName, stats in results:
+                events += self.feed.update(minerName, stats)
+
+            if events and self.clients:
+                data = b"".join(encodeEvent(event) for event in events)
+                for conn, buffer in self.clients.items():
+                    if buffer is None:
+                        continue
+                    if len(buffer) + len(data) > self.maxBuffer:
+                        self.clients[conn] = None
+                    else:
+                        buffer += data
+                self.wake()
+
+        return events
+
+    def wake(self):
+        try:
+            self.wakeupSend.send(b"\0")
+        except BlockingIOError:
+            # Already woken up
+            pass
+
+    # Only this thread touches the sockets and the selector
+    def run(self):
+        while not self.closing:
+            for key, mask in self.selector.select():
+                if key.fileobj is self.sock:
+                    self.acceptClients()
+                elif key.fileobj is self.wakeupRecv:
+                    try:
+                        while self.wakeupRecv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif mask & selectors.EVENT_READ:
+                    # Clients aren't expected to send anything, readable means they closed the connection
+                    try:
+                        data = key.fileobj.recv(4096)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b""
+                    if not data:
+                        with self.lock:
+                            self.clients[key.fileobj] = None
+
+            with self.lock:
+                for conn, buffer in list(self.clients.items()):
+                    if buffer:
+                        try:
+                            del buffer[:conn.send(buffer)]
+                        except BlockingIOError:
+                            pass
+                        except OSError:
+                            buffer = None
+
+                    if buffer is None:
+                        self.selector.unregister(conn)
+                        conn.close()
+                        del self.clients[conn]
+                    else:
+                        self.selector.modify(conn, selectors.EVENT_READ | selectors.EVENT_WRITE if buffer else selectors.EVENT_READ)
+
+    def acceptClients(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+
+            conn.setblocking(False)
+            with self.lock:
+                self.clients[conn] = bytearray(b"".join(encodeEvent(event) for event in self.feed.snapshot()))
+                self.selector.register(conn, selectors.EVENT_READ)
+
+    def close(self):
+        if self.thread:
+            self.closing = True
+            self.wake()
+            self.thread.join()
+            self.thread = None
+
+        if self.selector:
+            self.selector.close()
+            self.selector = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        for sock in (self.wakeupRecv, self.wakeupSend):
+            if sock:
+                sock.close()
+        self.wakeupRecv = None
+        self.wakeupSend = None
+
+        with self.lock:
+            for conn in self.clients:
+                conn.close()
+            self.clients = {}
+
+        try:
+            os.unlink(self.socketPath)
+        except FileNotFoundError:
+            pass
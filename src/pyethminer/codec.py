@@ -0,0 +1,42 @@
+# JSON codec for the API clients, uses orjson or ujson when installed and falls back to the standard library
+# Author: Ziah Jyothi
+
+# loads() takes the raw bytes received from the miner, dumps() returns bytes ready to send
+try:
+    import orjson
+
+    codecName = "orjson"
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    try:
+        import ujson
+
+        codecName = "ujson"
+        loads = ujson.loads
+
+        def dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+    except ImportError:
+        import json
+
+        codecName = "json"
+        # json.loads detects the encoding of bytes itself
+        loads = json.loads
+
+        def dumps(obj):
+            return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+# Requests without params (miner_getstat1, miner_ping, ...) only differ in their ID, so everything before the ID is
+# serialized once per method
+requestTemplates = {}
+
+def encodeRequest(request):
+    if len(request) == 3 and "jsonrpc" in request and "method" in request and "id" in request and isinstance(request["id"], int):
+        template = requestTemplates.get((request["jsonrpc"], request["method"]))
+        if template is None:
+            template = dumps({"jsonrpc": request["jsonrpc"], "method": request["method"]})[:-1] + b",\"id\":"
+            requestTemplates[(request["jsonrpc"], request["method"])] = template
+        return b"".join((template, str(request["id"]).encode("ascii"), b"}\n"))
+
+    return dumps(request) + b"\n"
@@ -0,0 +1,135 @@
+# minectl configuration loading, validated configs are cached in marshal form so unchanged configs skip TOML parsing
+# Author: Ziah Jyothi
+
+import os
+import marshal
+
+cacheVersion = 5
+apiTypes = ("ethminer", "nbminer")
+
+def getCacheFile(configFile):
+    cacheDir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "minectl")
+    return os.path.join(cacheDir, os.path.abspath(configFile).replace(os.sep, "%") + ".cache")
+
+# Parses and validates the TOML config, raises RuntimeError listing every problem found
+def compileConfig(configFile):
+    import toml
+
+    try:
+        config = toml.load(configFile)
+    except toml.TomlDecodeError as e:
+        raise RuntimeError("Invalid TOML: {}".format(e))
+
+    errors = []
+
+    maxWorkers = config.get("max_workers", 32)
+    if isinstance(maxWorkers, bool) or not isinstance(maxWorkers, int) or maxWorkers < 1:
+        errors.append("max_workers must be a positive integer")
+
+    if not isinstance(config.get("miners"), list):
+        raise RuntimeError("missing miners list")
+
+    miners = []
+    names = set()
+    for i, miner in enumerate(config["miners"]):
+        where = "miners[{}]".format(i)
+        if not isinstance(miner, dict):
+            errors.append("{}: not a table".format(where))
+            continue
+
+        name = miner.get("name")
+        if not isinstance(name, str) or not name:
+            errors.append("{}: missing name".format(where))
+            continue
+        where = "miner \"{}\"".format(name)
+
+        if name in names:
+            errors.append("{}: duplicate name".format(where))
+        names.add(name)
+
+        miner = dict(miner)
+        miner.setdefault("api_type", "ethminer")
+
+        if miner["api_type"] == "ethminer":
+            miner.setdefault("port", 3333)
+            if not isinstance(miner.get("host"), str):
+                errors.append("{}: missing host".format(where))
+            if isinstance(miner["port"], bool) or not isinstance(miner["port"], int) or not 0 < miner["port"] < 65536:
+                errors.append("{}: invalid port {}".format(where, miner["port"]))
+        elif miner["api_type"] == "nbminer":
+            if not isinstance(miner.get("url"), str):
+                errors.append("{}: missing url".format(where))
+            elif not miner["url"].startswith(("http://", "https://")):
+                errors.append("{}: unsupported url {}, expected http:// or https://".format(where, miner["url"]))
+        else:
+            errors.append("{}: unknown api_type \"{}\", expected one of {}".format(where, miner["api_type"], ", ".join(apiTypes)))
+
+        tags = miner.setdefault("tags", {})
+        if not isinstance(tags, dict) or not all(isinstance(value, (str, int)) for value in tags.values()):
+            errors.append("{}: tags must be a table of strings".format(where))
+        else:
+            miner["tags"] = {key: str(value) for key, value in tags.items()}
+
+        groups = miner.setdefault("groups", [])
+        if not isinstance(groups, list) or not all(isinstance(group, str) for group in groups):
+            errors.append("{}: groups must be a list of strings".format(where))
+
+        pollInterval = miner.get("poll_interval")
+        if pollInterval is not None and (isinstance(pollInterval, bool) or not isinstance(pollInterval, (int, float)) or pollInterval <= 0):
+            errors.append("{}: poll_interval must be a positive number of seconds".format(where))
+
+        miners.append(miner)
+
+    if errors:
+        raise RuntimeError("\n  ".join([""] + errors))
+
+    return {"max_workers": maxWorkers, "miners": miners, "index": buildIndex(miners)}
+
+# Inverted index from "key=value" tags (plus the implicit backend=<api_type>) and group names to miner names
+def buildIndex(miners):
+    tagIndex = {}
+    groupIndex = {}
+
+    for miner in miners:
+        tagIndex.setdefault("backend={}".format(miner["api_type"]), []).append(miner["name"])
+        for key, value in miner["tags"].items():
+            tagIndex.setdefault("{}={}".format(key, value), []).append(miner["name"])
+        for group in miner["groups"]:
+            groupIndex.setdefault(group, []).append(miner["name"])
+
+    return {"tags": tagIndex, "groups": groupIndex}
+
+def writeCache(cacheFile, key, config):
+    try:
+        data = marshal.dumps((cacheVersion, key, config))
+    except ValueError:
+        # Values marshal can't store (e.g. TOML dates), just don't cache
+        return
+
+    try:
+        os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+        tmpFile = "{}.{}.tmp".format(cacheFile, os.getpid())
+        with open(tmpFile, "wb") as f:
+            f.write(data)
+        os.replace(tmpFile, cacheFile)
+    except OSError:
+        pass
+
+# Returns the validated config, from the cache if the TOML file's path, mtime and size still match
+def loadConfig(configFile):
+    st = os.stat(configFile)
+    key = (os.path.abspath(configFile), st.st_mtime_ns, st.st_size)
+    cacheFile = getCacheFile(configFile)
+
+    try:
+        with open(cacheFile, "rb") as f:
+            version, cachedKey, config = marshal.loads(f.read())
+        if version == cacheVersion and tuple(cachedKey) == key:
+            return config
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    config = compileConfig(configFile)
+    writeCache(cacheFile, key, config)
+
+    return config
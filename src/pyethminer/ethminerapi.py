@@ -3,33 +3,68 @@
 
 import socket
 import fcntl, os
-import json
+import selectors
 import time
+from pyethminer import codec
+from pyethminer.stats import MinerStats, DeviceStats
 
 class EthminerApi:
     jsonApiVersion = "2.0"
 
     def __init__(self):
         self.debug = False
+        self.timeout = 1
         self.sock = None
+        self.selector = None
+        self.recvBuffer = bytearray()
         self.connected = False
         self.lastConnected = 0
         self.nextRequestId = 0
+        self.pendingRequests = {}
+        self.topologyTtl = 60
+        self.gpuIndices = None
+        self.gpuIndicesUpdated = 0
+        self.instrumentation = None
+        self.label = None
+        self.host = None
+        self.port = None
+        # Requests answered on the current connection
+        self.answeredRequests = 0
+
     def __del__(self):
         self.disconnect()
 
     def connect(self, host = "localhost", port = 3333):
         self.connected = False
+        self.host = host
+        self.port = port
+        self.answeredRequests = 0
+        if self.label is None:
+            self.label = "{}:{}".format(host, port)
+
+        instrumentation = self.instrumentation
+        if instrumentation:
+            connectStart = time.perf_counter()
+
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.settimeout(1)
+            self.sock.settimeout(self.timeout)
             self.sock.connect((host, port))
             self.sock.settimeout(None)
 
             fcntl.fcntl(self.sock, fcntl.F_SETFL, os.O_NONBLOCK)
+
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.sock, selectors.EVENT_READ)
+            self.recvBuffer = bytearray()
+            self.pendingRequests = {}
+            self.invalidateTopology()
         except OSError as e:
             self.onDisconnect()
             raise e
+        finally:
+            if instrumentation:
+                instrumentation.record(self.label, "connect", "connect", time.perf_counter() - connectStart)
 
         self.connected = True
         self.onConnect()
@@ -43,6 +78,12 @@ class EthminerApi:
         self.lastConnected = 0
 
     def onDisconnect(self):
+        self.invalidateTopology()
+
+        if self.selector:
+            self.selector.close()
+            self.selector = None
+
         if self.sock:
             self.sock.close()
 
@@ -57,61 +98,154 @@ class EthminerApi:
             print("Miner connection failed again: {}".format(self.sock))
 
     def sendRequest(self, request):
+        return self.sendRequests([request])[0]
+
+    # Sends all requests back to back and then collects the responses by ID, so N requests cost about one round trip.
+    # Responses are returned in request order, None for any that didn't arrive before the timeout.
+    def sendRequests(self, requests):
         if not self.connected or not self.sock:
             raise RuntimeError("Unable to send request when disconnected")
+        if not requests:
+            return []
+
+        # A connection kept open since earlier requests may have been closed by the miner in the meantime (a restart or
+        # an idle close), which only shows once it is used. Retry once on a new connection if none of the responses
+        # arrived.
+        reused = self.answeredRequests > 0
+        answeredBefore = self.answeredRequests
+        try:
+            return self.exchangeRequests(requests)
+        except ConnectionError:
+            if not reused or self.answeredRequests != answeredBefore:
+                raise
 
-        request["id"] = self.nextRequestId
-        self.nextRequestId = self.nextRequestId + 1
+        self.connect(self.host, self.port)
+        return self.exchangeRequests(requests)
 
-        if self.debug:
-            print("Sending: {}".format(request))
+    def exchangeRequests(self, requests):
+        instrumentation = self.instrumentation
+        if instrumentation:
+            sendStart = time.perf_counter()
+
+        requestData = bytearray()
+        for request in requests:
+            request["id"] = self.nextRequestId
+            self.nextRequestId = self.nextRequestId + 1
+            self.pendingRequests[request["id"]] = None
+
+            if self.debug:
+                print("Sending: {}".format(request))
+
+            requestData += codec.encodeRequest(request)
 
-        requestStr = json.dumps(request)
         try:
-            self.sock.sendall(requestStr.encode("utf-8") + b"\n")
+            self.sock.sendall(requestData)
         except ConnectionError:
             self.onDisconnect()
             raise
 
-        response = b""
-        bytesReceived = 0
-        timeout = time.time() + 1
+        if instrumentation:
+            waitStart = time.perf_counter()
+            instrumentation.record(self.label, requests[0]["method"], "send", waitStart - sendStart)
+
+        outstanding = len(requests)
+        timeout = time.time() + self.timeout
+
+        try:
+            while outstanding > 0:
+                response = self.readResponse(timeout)
+                if response is None:
+                    # The miner is hung or the connection is dead, late responses would only confuse the next
+                    # request so start over on a new connection
+                    self.onDisconnect()
+                    break
+
+                if self.debug:
+                    print("Response: {}".format(response))
+
+                if not isinstance(response, dict):
+                    raise RuntimeError("Invalid response from miner: {!r}".format(response))
+
+                if self.pendingRequests.get(response.get("id"), False) is None:
+                    self.pendingRequests[response["id"]] = response
+                    self.answeredRequests += 1
+                    outstanding -= 1
+                else:
+                    print("Warning: received response with unexpected ID {}, ignoring".format(response.get("id")))
+        except (ValueError, RuntimeError):
+            # A malformed response leaves the stream out of sync
+            self.onDisconnect()
+            raise
+        finally:
+            responses = [self.pendingRequests.pop(request["id"], None) for request in requests]
+
+            if instrumentation:
+                instrumentation.record(self.label, requests[0]["method"], "wait", time.perf_counter() - waitStart)
+
+        return responses
+
+    # Returns the next newline-delimited response, bytes after it stay buffered for the next call. Returns None if the
+    # timeout passes first.
+    def readResponse(self, timeout):
+        searchStart = 0
+
+        while True:
+            newline = self.recvBuffer.find(b"\n", searchStart)
+            if newline != -1:
+                line = self.recvBuffer[:newline]
+                del self.recvBuffer[:newline + 1]
+                searchStart = 0
+
+                if line and not line.isspace():
+                    return codec.loads(line)
+                continue
+
+            searchStart = len(self.recvBuffer)
+
+            remaining = timeout - time.time()
+            if remaining <= 0:
+                return None
+
+            if not self.selector.select(remaining):
+                continue
 
-        while time.time() < timeout:
             try:
-                response += self.sock.recv(1024)
+                data = self.sock.recv(65536)
             except BlockingIOError:
-                time.sleep(10 / 1000)
                 continue
             except ConnectionError:
                 self.onDisconnect()
                 raise
-            else:
-                bytesReceived += len(response)
-
-                if b"\n" in response:
-                    response = response.strip()
 
-                    response = json.loads(response)
-
-                    if self.debug:
-                        print("Response: {}".format(response))
+            if not data:
+                self.onDisconnect()
+                raise ConnectionResetError("Miner closed the connection")
 
-                    if response["id"] == request["id"]:
-                        return response
-                    else:
-                        print("Warning: response doesn't have same ID as request {} != {}, waiting for another response...".format(response["id"], request["id"]))
+            self.recvBuffer += data
 
-    def handleResponse(self, response, errMsg = "", expectedResponse = True):
+    @staticmethod
+    def handleResponse(response, errMsg = "", expectedResponse = True):
         if not response:
             raise RuntimeError(errMsg)
         elif "error" in response:
-            raise RuntimeError("{} ({}): {}".format(errMsg, response["error"]["code"], response["error"]["message"]))
+            error = response["error"]
+            if isinstance(error, dict):
+                raise RuntimeError("{} ({}): {}".format(errMsg, error.get("code"), error.get("message")))
+            raise RuntimeError("{}: {}".format(errMsg, error))
         elif "result" not in response:
             raise RuntimeError("{}: invalid response, missing result".format(errMsg))
         elif expectedResponse != None and response["result"] != expectedResponse:
             raise RuntimeError("{}: invalid response, unexpected result: {} != {}".format(errMsg, response["result"], expectedResponse))
 
+    # Runs parser on a result, a result that doesn't have the shape the parser expects is the miner's failure and raised
+    # as RuntimeError like any other bad response
+    @staticmethod
+    def parseResult(parser, result, errMsg):
+        try:
+            return parser(result)
+        except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+            raise RuntimeError("{}: {}".format(errMsg, repr(e)))
+
     def authorize(self, password):
         response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "api_authorize", "params": { "psw": password }})
 
@@ -127,58 +261,133 @@ class EthminerApi:
 
         self.handleResponse(response, "Failed to get statistics", None)
 
-        status1 = response["result"][2].split(";")
-        #gpuHashrates = [float(i) / 1000 for i in response["result"][3].split(";")]
-        #gpuTempFanSpeed = list(map(float, response["result"][6].split(";")))
-        status2 = response["result"][8].split(";")
+        instrumentation = self.instrumentation
+        if instrumentation:
+            parseStart = time.perf_counter()
+
+        stats = EthminerApi.parseResult(EthminerApi.parseStats, response["result"], "Invalid statistics")
+
+        if instrumentation:
+            instrumentation.record(self.label, "miner_getstat1", "parse", time.perf_counter() - parseStart)
+        self.updateTopology(len(stats["devices"]))
+
+        return stats
+
+    @staticmethod
+    def parseStats(result):
+        # "hashrate;accepted;rejected" and "failed;pool switches" are split with partition, the per-GPU lists are
+        # walked in step, temperature and fan speed alternate
+        hashrate, _, shares = result[2].partition(";")
+        sharesAccepted, _, sharesRejected = shares.partition(";")
+        sharesFailed, _, poolSwitches = result[8].partition(";")
 
         devices = []
-        gpuHashrateData = response["result"][3].split(";")
-        gpuTempFanData = response["result"][6].split(";")
-        for i in range(round(len(gpuTempFanData) / 2)):
-            devices.append({
-                #"name": dev["info"],
-                #"pci_bus_id": dev["pci_bus_id"],
-                #"accepted_shares": dev["accepted_shares"],
-                #"rejected_shares": dev["rejected_shares"],
-                #"invalid_shares": dev["invalid_shares"],
-                "hashrate": float(gpuHashrateData[i]) / 1000,
-                #"core_clock": dev["core_clock"],
-                #"memory_clock": dev["mem_clock"],
-                #"core_usage": dev["core_utilization"],
-                #"memory_usage": dev["mem_utilization"],
-                #"lhr_target": dev["lhr"],
-                "core_temp": int(gpuTempFanData[i * 2]),
-                #"mem_temp": dev["memTemperature"],
-                "fan": int(gpuTempFanData[i * 2 + 1]),
-                #"power": dev["power"]
-            })
-
-        return {
-            "version": response["result"][0],
-            "runtime": int(int(response["result"][1]) * 60),
-            "hashrate": float(status1[0]) / 1000,
-            "sharesAccepted": int(status1[1]),
-            "sharesRejected": int(status1[2]),
-            "sharesFailed": int(status2[0]),
-            "devices": devices,
-            #"gpuTempFanSpeed": gpuTempFanSpeed,
-            "activePool": response["result"][7],
-            "poolSwitches": int(status2[1])
-        }
-
-    def getDetailedStats(self):
+        tempFanData = iter(result[6].split(";"))
+        for gpuHashrate, coreTemp, fan in zip(result[3].split(";"), tempFanData, tempFanData):
+            devices.append(DeviceStats(hashrate=float(gpuHashrate) / 1000, core_temp=int(coreTemp), fan=int(fan)))
+
+        return MinerStats(
+            version=result[0],
+            runtime=int(result[1]) * 60,
+            hashrate=float(hashrate) / 1000,
+            sharesAccepted=int(sharesAccepted),
+            sharesRejected=int(sharesRejected.partition(";")[0]),
+            sharesFailed=int(sharesFailed),
+            devices=devices,
+            activePool=result[7],
+            poolSwitches=int(poolSwitches.partition(";")[0])
+        )
+
+    # Returns the miner_getstatdetail result parsed into MinerStats, or the result as is with raw
+    def getDetailedStats(self, raw = False):
         response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_getstatdetail"})
 
         self.handleResponse(response, "Failed to get detailed statistics", None)
 
-        return response["result"]
+        if raw:
+            return response["result"]
+
+        instrumentation = self.instrumentation
+        if instrumentation:
+            parseStart = time.perf_counter()
+
+        stats = EthminerApi.parseResult(EthminerApi.parseDetailedStats, response["result"], "Invalid detailed statistics")
+
+        if instrumentation:
+            instrumentation.record(self.label, "miner_getstatdetail", "parse", time.perf_counter() - parseStart)
+
+        return stats
+
+    @staticmethod
+    def parseDetailedStats(result):
+        if not isinstance(result, dict):
+            raise RuntimeError("Invalid detailed statistics: {!r}".format(result))
+
+        # Share lists are [accepted, rejected, failed, seconds since the last share], hashrates are hex H/s and sensors
+        # are [temperature, fan, power]
+        def item(values, index):
+            return values[index] if values and index < len(values) else None
+
+        def hashrate(value):
+            if value is None:
+                return None
+            return (int(value, 16) if isinstance(value, str) else value) / 1000000
+
+        devices = []
+        for device in result.get("devices") or ():
+            hardware = device.get("hardware") or {}
+            mining = device.get("mining") or {}
+            sensors = hardware.get("sensors")
+            shares = mining.get("shares")
+            segment = mining.get("segment")
+
+            devices.append(DeviceStats(
+                name=hardware.get("name"),
+                pci_bus_id=hardware.get("pci"),
+                accepted_shares=item(shares, 0),
+                rejected_shares=item(shares, 1),
+                failed_shares=item(shares, 2),
+                last_share_age=item(shares, 3),
+                hashrate=hashrate(mining.get("hashrate")),
+                core_temp=item(sensors, 0),
+                fan=item(sensors, 1),
+                power=item(sensors, 2),
+                index=device.get("_index"),
+                mode=device.get("_mode"),
+                paused=mining.get("paused"),
+                pause_reason=mining.get("pause_reason"),
+                segment=tuple(int(value, 16) if isinstance(value, str) else value for value in segment) if segment else None
+            ))
+
+        host = result.get("host") or {}
+        mining = result.get("mining") or {}
+        connection = result.get("connection") or {}
+        shares = mining.get("shares")
+
+        return MinerStats(
+            version=host.get("version"),
+            runtime=host.get("runtime"),
+            hashrate=hashrate(mining.get("hashrate")),
+            sharesAccepted=item(shares, 0),
+            sharesRejected=item(shares, 1),
+            sharesFailed=item(shares, 2),
+            lastShareAge=item(shares, 3),
+            devices=devices,
+            activePool=connection.get("uri"),
+            poolSwitches=connection.get("switches"),
+            hostname=host.get("name"),
+            connected=connection.get("connected"),
+            difficulty=mining.get("difficulty"),
+            epoch=mining.get("epoch")
+        )
 
     def restart(self):
         response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_restart"})
 
         self.handleResponse(response, "Failed to restart miner")
 
+        self.invalidateTopology()
+
     def shuffleScrambler(self):
         response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_shuffle"})
 
@@ -203,25 +412,44 @@ class EthminerApi:
 
         self.handleResponse(response, "Failed to get pools", None)
 
-        return response["result"]
+        return EthminerApi.parseResult(EthminerApi.parsePools, response["result"], "Invalid pools")
+
+    @staticmethod
+    def parsePools(result):
+        if not isinstance(result, list) or not all(isinstance(pool, dict) and "index" in pool and "active" in pool for pool in result):
+            raise ValueError("expected a list of connections")
+        return result
 
     def setActivePool(self, index):
         response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_setactiveconnection", "params": { "index": index }})
 
         self.handleResponse(response, "Failed to set active pool")
 
+    # GPU indices seen in the last getStats response, kept for topologyTtl seconds so operations on all GPUs don't need
+    # a stats round trip first
+    def updateTopology(self, gpuCount):
+        self.gpuIndices = list(range(gpuCount))
+        self.gpuIndicesUpdated = time.time()
+
+    def invalidateTopology(self):
+        self.gpuIndices = None
+        self.gpuIndicesUpdated = 0
+
+    def getGpuIndices(self, index = -1):
+        if index != -1:
+            return [index]
+
+        if self.gpuIndices is None or time.time() - self.gpuIndicesUpdated > self.topologyTtl:
+            self.getStats()
+
+        return self.gpuIndices
+
     def pauseGpu(self, index, pause = True):
-        indices = []
-        if index == -1:
-            stats = self.getStats()
-            for idx in range(0, len(stats["gpuHashrates"])):
-                indices.append(idx)
-        else:
-            indices.append(index)
+        indices = self.getGpuIndices(index)
 
-        for idx in indices:
-            response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_pausegpu", "params": { "index": idx, "pause": pause }})
+        responses = self.sendRequests([{"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_pausegpu", "params": { "index": idx, "pause": pause }} for idx in indices])
 
+        for idx, response in zip(indices, responses):
             self.handleResponse(response, "Failed to pause GPU {}".format(idx))
 
     def setVerbosity(self, verbosity):
@@ -230,15 +458,9 @@ class EthminerApi:
         self.handleResponse(response, "Failed to set verbosity")
 
     def setLhrTune(self, index, tune):
-        indices = []
-        if index == -1:
-            stats = self.getStats()
-            for idx in range(0, len(stats["gpuHashrates"])):
-                indices.append(idx)
-        else:
-            indices.append(index)
+        indices = self.getGpuIndices(index)
 
-        for idx in indices:
-            response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_setlhrtune", "params": { "index": idx, "tune": tune}})
+        responses = self.sendRequests([{"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_setlhrtune", "params": { "index": idx, "tune": tune}} for idx in indices])
 
+        for idx, response in zip(indices, responses):
             self.handleResponse(response, "Failed to set LHR tune for GPU {}".format(idx))
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Prometheus metrics exporter for miner statistics
+# Author: Ziah Jyothi
+
+import time
+import threading
+import socketserver
+import http.server
+
+def escapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+# Polls miners on its own schedule and renders the metrics page once per poll, scrapes only return the last rendered
+# page so they never wait on a miner
+class MetricsExporter:
+    prefix = "pyethminer_"
+
+    # pollFunc() returns {minerName: (stats, pollSeconds)} with None for miners that couldn't be polled, miners left out
+    # keep their last values. nextPollFunc() optionally returns when the next poll is due if that's before interval.
+    def __init__(self, pollFunc, interval = 15, nextPollFunc = None):
+        self.pollFunc = pollFunc
+        self.interval = interval
+        self.nextPollFunc = nextPollFunc
+        self.lastStats = {}
+        self.lastSuccess = {}
+        self.pollDurations = {}
+        self.up = {}
+        self.lastPoll = 0
+        self.page = b""
+
+    def poll(self):
+        results = self.pollFunc()
+        if not results and self.page:
+            return
+
+        for minerName, result in results.items():
+            self.up[minerName] = result is not None
+            if result is None:
+                continue
+
+            self.lastStats[minerName], self.pollDurations[minerName] = result
+            self.lastSuccess[minerName] = time.time()
+
+        self.lastPoll = time.time()
+        self.page = self.render().encode("utf-8")
+
+    def render(self):
+        lines = []
+
+        def addMetric(name, metricType, helpText, samples):
+            lines.append("# HELP {}{} {}".format(MetricsExporter.prefix, name, helpText))
+            lines.append("# TYPE {}{} {}".format(MetricsExporter.prefix, name, metricType))
+            for labels, value in samples:
+                labelStr = ",".join("{}=\"{}\"".format(key, escapeLabel(labelValue)) for key, labelValue in labels)
+                lines.append("{}{}{{{}}} {}".format(MetricsExporter.prefix, name, labelStr, value))
+
+        def minerSamples(key, transform = None):
+            samples = []
+            for minerName, stats in self.lastStats.items():
+                value = stats.get(key)
+                if value is not None:
+                    samples.append(((("miner", minerName),), transform(value) if transform else value))
+            return samples
+
+        def deviceSamples(key):
+            samples = []
+            for minerName, stats in self.lastStats.items():
+                for idx, dev in enumerate(stats["devices"]):
+                    value = dev.get(key)
+                    if value is not None:
+                        samples.append(((("miner", minerName), ("device", idx)), value))
+            return samples
+
+        addMetric("up", "gauge", "Whether the last poll of the miner succeeded", [((("miner", minerName),), int(up)) for minerName, up in self.up.items()])
+        addMetric("poll_duration_seconds", "gauge", "Duration of the last successful poll of the miner", [((("miner", minerName),), duration) for minerName, duration in self.pollDurations.items()])
+        addMetric("last_success_timestamp_seconds", "gauge", "Time of the last successful poll of the miner", [((("miner", minerName),), timestamp) for minerName, timestamp in self.lastSuccess.items()])
+        addMetric("info", "gauge", "Miner software version", [((("miner", minerName), ("version", stats["version"])), 1) for minerName, stats in self.lastStats.items()])
+        addMetric("runtime_seconds", "gauge", "Miner uptime", minerSamples("runtime"))
+        addMetric("hashrate_mhs", "gauge", "Total miner hashrate in Mh/s", minerSamples("hashrate"))
+
+        shareSamples = []
+        for status, key in (("accepted", "sharesAccepted"), ("rejected", "sharesRejected"), ("failed", "sharesFailed")):
+            shareSamples += [((labels[0], ("status", status)), value) for labels, value in minerSamples(key)]
+        addMetric("shares_total", "counter", "Shares submitted by the miner", shareSamples)
+
+        addMetric("pool_switches_total", "counter", "Pool switches since the miner started", minerSamples("poolSwitches"))
+        addMetric("device_hashrate_mhs", "gauge", "GPU hashrate in Mh/s", deviceSamples("hashrate"))
+        addMetric("device_core_temp_celsius", "gauge", "GPU core temperature", deviceSamples("core_temp"))
+        addMetric("device_mem_temp_celsius", "gauge", "GPU memory temperature", deviceSamples("mem_temp"))
+        addMetric("device_fan_percent", "gauge", "GPU fan speed", deviceSamples("fan"))
+        addMetric("device_power_watts", "gauge", "GPU power draw", deviceSamples("power"))
+
+        lines.append("# HELP {}exporter_last_poll_timestamp_seconds Time the exporter last finished polling miners".format(MetricsExporter.prefix))
+        lines.append("# TYPE {}exporter_last_poll_timestamp_seconds gauge".format(MetricsExporter.prefix))
+        lines.append("{}exporter_last_poll_timestamp_seconds {}".format(MetricsExporter.prefix, self.lastPoll))
+
+        return "\n".join(lines) + "\n"
+
+    def pollForever(self):
+        while True:
+            pollStart = time.time()
+            try:
+                self.poll()
+            except Exception as e:
+                print("Failed to poll miners: {}".format(e))
+            nextPoll = pollStart + self.interval
+            if self.nextPollFunc:
+                nextPoll = min(nextPoll, self.nextPollFunc())
+            time.sleep(max(0.1, nextPoll - time.time()))
+
+    def serve(self, host = "", port = 9910):
+        exporter = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                page = exporter.page
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, format, *args):
+                pass
+
+        class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        pollThread = threading.Thread(target=self.pollForever, daemon=True)
+        pollThread.start()
+
+        server = MetricsServer((host, port), MetricsHandler)
+        print("Serving metrics on http://{}:{}/metrics".format(host or "0.0.0.0", port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,139 @@
+# Automatic pool failover from share statistics
+# Author: Ziah Jyothi
+
+import collections
+import socket
+import time
+
+class MinerFailoverState:
+    def __init__(self):
+        # (timestamp, accepted, rejected, failed, hashrate) of the current pool only
+        self.samples = collections.deque()
+        self.activePool = None
+        self.poolSwitches = None
+        self.degradedChecks = 0
+        self.holdUntil = 0
+        # Pool index -> time until which it isn't switched to again
+        self.penalties = {}
+
+# Decides when to move a miner off its active pool. Share counters are kept for a sliding window per miner and reset
+# whenever the miner switches pools or restarts, so the rates always describe the active pool. A pool counts as
+# degraded when more than maxRejectRate or maxFailedRate of at least minShares shares were rejected/failed, or when the
+# miner hashed for half the window without a single accepted share.
+#
+# Hysteresis: a pool has to be degraded on confirmChecks checks in a row, after any switch the miner is left alone for
+# holdTime and a pool that was switched away from isn't switched back to for penaltyTime.
+class PoolFailover:
+    def __init__(self, window = 600, maxRejectRate = 0.05, maxFailedRate = 0.05, minShares = 20, confirmChecks = 2, holdTime = 900, penaltyTime = 1800):
+        self.window = window
+        self.maxRejectRate = maxRejectRate
+        self.maxFailedRate = maxFailedRate
+        self.minShares = minShares
+        self.confirmChecks = confirmChecks
+        self.holdTime = holdTime
+        self.penaltyTime = penaltyTime
+        self.states = {}
+
+    def getState(self, minerName):
+        state = self.states.get(minerName)
+        if state is None:
+            state = MinerFailoverState()
+            self.states[minerName] = state
+        return state
+
+    def addSample(self, minerName, stats, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+        sample = (now, stats["sharesAccepted"], stats["sharesRejected"], stats["sharesFailed"], stats["hashrate"])
+
+        poolChanged = state.activePool is not None and (stats.get("activePool") != state.activePool or stats.get("poolSwitches") != state.poolSwitches)
+        restarted = state.samples and any(new < old for new, old in zip(sample[1:4], state.samples[-1][1:4]))
+        if poolChanged or restarted:
+            state.samples.clear()
+            state.degradedChecks = 0
+            if poolChanged:
+                state.holdUntil = max(state.holdUntil, now + self.holdTime)
+
+        state.activePool = stats.get("activePool")
+        state.poolSwitches = stats.get("poolSwitches")
+        state.samples.append(sample)
+
+        while state.samples and state.samples[0][0] < now - self.window:
+            state.samples.popleft()
+
+    # Returns the reason the active pool counts as degraded or None
+    def degradedReason(self, minerName):
+        samples = self.getState(minerName).samples
+        if len(samples) < 2:
+            return None
+
+        first, last = samples[0], samples[-1]
+        span = last[0] - first[0]
+        accepted, rejected, failed = (new - old for new, old in zip(last[1:4], first[1:4]))
+        shares = accepted + rejected + failed
+
+        if shares >= self.minShares:
+            if rejected / shares > self.maxRejectRate:
+                return "{:.1%} of {} shares rejected in {}s".format(rejected / shares, shares, round(span))
+            if failed / shares > self.maxFailedRate:
+                return "{:.1%} of {} shares failed in {}s".format(failed / shares, shares, round(span))
+
+        if span >= self.window / 2 and accepted == 0 and last[4] > 0:
+            return "no accepted shares in {}s".format(round(span))
+
+        return None
+
+    # Returns the reason to fail over once the pool was degraded on enough checks in a row and the miner isn't in its
+    # hold time, None otherwise
+    def check(self, minerName, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        reason = self.degradedReason(minerName)
+        if reason is None:
+            state.degradedChecks = 0
+            return None
+
+        state.degradedChecks += 1
+        if state.degradedChecks < self.confirmChecks or now < state.holdUntil:
+            return None
+
+        return reason
+
+    # pools is the list from EthminerApi.getPools(), latencies maps pool indices to their connect time or None if
+    # unreachable. Picks the reachable, unpenalized pool with the lowest latency, preferring earlier pools on ties.
+    def chooseAlternative(self, minerName, pools, latencies, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        candidates = []
+        for pool in pools:
+            index = pool["index"]
+            if pool["active"] or latencies.get(index) is None or state.penalties.get(index, 0) > now:
+                continue
+            candidates.append((latencies[index], index))
+
+        return min(candidates)[1] if candidates else None
+
+    def recordSwitch(self, minerName, fromIndex, toIndex, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        if fromIndex is not None:
+            state.penalties[fromIndex] = now + self.penaltyTime
+        state.holdUntil = now + self.holdTime
+        state.degradedChecks = 0
+        state.samples.clear()
+
+# TCP connect time to a pool from getPools() in seconds, None if it can't be reached within timeout
+def probePool(pool, timeout = 2):
+    start = time.time()
+    try:
+        with socket.create_connection((pool["host"], pool["port"]), timeout):
+            return time.time() - start
+    except OSError:
+        return None
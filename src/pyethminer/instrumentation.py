@@ -0,0 +1,86 @@
+# Per-request timing instrumentation for the API clients
+# Author: Ziah Jyothi
+
+import math
+import threading
+
+# Fixed exponential buckets from 10us growing by 25% each, the last bucket catches everything above ~10 minutes
+class Histogram:
+    bucketStart = 0.00001
+    bucketFactor = 1.25
+    bucketCount = 80
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * Histogram.bucketCount
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        bucket = 0
+        if seconds > Histogram.bucketStart:
+            bucket = min(Histogram.bucketCount - 1, int(math.log(seconds / Histogram.bucketStart, Histogram.bucketFactor)) + 1)
+        self.buckets[bucket] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Upper bound of the bucket holding the p-th percentile, clamped to the observed range
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return max(self.min, min(self.max, Histogram.bucketStart * Histogram.bucketFactor ** bucket))
+        return self.max
+
+# Collects timings of each (miner, method, phase) in histograms and passes them on to callbacks. API clients only
+# time requests while their instrumentation attribute is set.
+class Instrumentation:
+    def __init__(self):
+        self.histograms = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def addCallback(self, callback):
+        self.callbacks.append(callback)
+
+    def removeCallback(self, callback):
+        self.callbacks.remove(callback)
+
+    def record(self, miner, method, phase, seconds):
+        key = (miner, method, phase)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[key] = histogram
+            histogram.add(seconds)
+
+        for callback in self.callbacks:
+            callback(miner, method, phase, seconds)
+
+    def report(self, limit = 20):
+        with self.lock:
+            entries = sorted(self.histograms.items(), key=lambda entry: entry[1].total, reverse=True)
+
+        lines = ["{:<24} {:<24} {:<8} {:>6} {:>10} {:>10} {:>10} {:>10}".format("miner", "method", "phase", "count", "mean ms", "p50 ms", "p90 ms", "max ms")]
+        for (miner, method, phase), histogram in entries[:limit]:
+            lines.append("{:<24} {:<24} {:<8} {:>6} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                str(miner), method, phase, histogram.count, histogram.mean() * 1000, histogram.percentile(50) * 1000, histogram.percentile(90) * 1000, histogram.max * 1000))
+        if len(entries) > limit:
+            lines.append("... {} more".format(len(entries) - limit))
+
+        return "\n".join(lines)
@@ -0,0 +1,137 @@
+# LHR tune search and the store of the best tune per device
+# Author: Ziah Jyothi
+
+import os
+import json
+import time
+
+# Pattern search over integer tunes in [low, high] for one GPU. Each candidate is measured and kept if its hashrate beats
+# the best by more than margin (so noise doesn't walk the search around), the search keeps going in the same direction
+# while that works, tries the other direction once it doesn't and halves the step when neither does. A hashrate below
+# collapseRatio of the best is an LHR lock: that tune and everything past it become the new bound and the best tune is
+# measured again to make sure the card recovered. Done once the step drops below 1.
+class TuneSearch:
+    def __init__(self, start, low, high, step, margin = 0.01, collapseRatio = 0.5):
+        self.low = low
+        self.high = high
+        self.step = step
+        self.margin = margin
+        self.collapseRatio = collapseRatio
+        self.best = None
+        self.bestHashrate = None
+        self.current = max(low, min(high, start))
+        self.direction = 1
+        self.triedReverse = False
+        self.recovering = False
+        self.done = False
+
+    def candidate(self):
+        return None if self.done else self.current
+
+    # Returns what the measurement meant: "baseline", "improved", "worse", "collapse", "recovered" or "locked"
+    def report(self, hashrate):
+        tune = self.current
+
+        if self.best is None:
+            self.best = tune
+            self.bestHashrate = hashrate
+            self.nextCandidate()
+            return "baseline"
+
+        if self.recovering:
+            self.recovering = False
+            if hashrate < self.bestHashrate * self.collapseRatio:
+                # Still locked at a tune that worked before, stop here and leave the card alone
+                self.done = True
+                return "locked"
+            self.bestHashrate = max(self.bestHashrate, hashrate)
+            self.nextCandidate()
+            return "recovered"
+
+        if hashrate < self.bestHashrate * self.collapseRatio:
+            if tune > self.best:
+                self.high = tune - 1
+            else:
+                self.low = tune + 1
+            self.recovering = True
+            self.current = self.best
+            return "collapse"
+
+        if hashrate > self.bestHashrate * (1 + self.margin):
+            self.best = tune
+            self.bestHashrate = hashrate
+            self.triedReverse = True
+            self.nextCandidate()
+            return "improved"
+
+        self.turn()
+        self.nextCandidate()
+        return "worse"
+
+    def turn(self):
+        if not self.triedReverse:
+            self.direction = -self.direction
+            self.triedReverse = True
+        else:
+            self.step //= 2
+            self.direction = 1
+            self.triedReverse = False
+
+    # Moves on to the next tune in range, turning around or shrinking the step when the next one would leave it
+    def nextCandidate(self):
+        while self.step >= 1:
+            tune = self.best + self.direction * self.step
+            if self.low <= tune <= self.high:
+                self.current = tune
+                return
+            self.turn()
+
+        self.done = True
+
+# Identifies each GPU by PCI bus ID (and name) where the miner reports it, falling back to its index, plus the miner
+# version since a tune found with one miner/driver build doesn't carry over to another
+def deviceKeys(minerName, stats, detail = None):
+    detailDevices = detail["devices"] if detail is not None else []
+
+    keys = []
+    for i, device in enumerate(stats["devices"]):
+        deviceId = device.get("pci_bus_id")
+        if deviceId is None and i < len(detailDevices) and detailDevices[i].get("pci_bus_id"):
+            deviceId = "{} {}".format(detailDevices[i]["pci_bus_id"], detailDevices[i].get("name", "")).strip()
+        if deviceId is None:
+            deviceId = "gpu{}".format(i)
+
+        keys.append("{}|{}|{}".format(minerName, deviceId, stats.get("version", "")))
+
+    return keys
+
+def getStoreFile():
+    stateDir = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(stateDir, "minectl", "lhr-tunes.json")
+
+# Best tune found per device key, kept as JSON so it survives reboots
+class TuneStore:
+    def __init__(self, storeFile = None):
+        self.storeFile = storeFile or getStoreFile()
+        self.tunes = {}
+
+        try:
+            with open(self.storeFile, "r") as f:
+                self.tunes = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            raise RuntimeError("Invalid LHR tune store {}: {}".format(self.storeFile, e))
+
+    def get(self, key):
+        return self.tunes.get(key)
+
+    def set(self, key, tune, hashrate):
+        self.tunes[key] = {"tune": tune, "hashrate": hashrate, "updated": int(time.time())}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.storeFile), exist_ok=True)
+        tmpFile = "{}.{}.tmp".format(self.storeFile, os.getpid())
+        with open(tmpFile, "w") as f:
+            json.dump(self.tunes, f, indent=2, sort_keys=True)
+        os.replace(tmpFile, self.storeFile)
@@ -0,0 +1,259 @@
+# Append-only, column-oriented on-disk log of miner stats
+# Author: Ziah Jyothi
+
+import os
+import math
+import re
+import itertools
+import mmap
+import struct
+import bisect
+import time
+from pyethminer.stats import MinerStats, DeviceStats
+
+# A segment file is a header followed by one fixed-width column after the other, each sized for capacity rows, so a
+# column can be read as a single array straight out of the mapping. Every sample is one miner row (device -1) followed
+# by a row per device. Missing values are -1 in integer columns and NaN in float columns. Strings (miner names, pools)
+# are ids into the segment's ".strings" file, one string per line.
+magic = b"PEML"
+formatVersion = 1
+# magic, version, capacity, rows, start time
+headerFormat = "<4sHxxIId"
+headerSize = 32
+
+columns = (
+    ("time", "d"),
+    ("miner", "h"),
+    ("device", "h"),
+    ("hashrate", "f"),
+    ("accepted", "i"),
+    ("rejected", "i"),
+    ("failed", "i"),
+    ("core_temp", "h"),
+    ("fan", "h"),
+    ("power", "f"),
+    ("runtime", "i"),
+    ("pool_switches", "i"),
+    ("pool", "h")
+)
+
+def columnOffsets(capacity):
+    offsets = {}
+    offset = headerSize
+    for name, fmt in columns:
+        offsets[name] = offset
+        offset += struct.calcsize(fmt) * capacity
+    return (offsets, offset)
+
+def getLogDir():
+    dataDir = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(dataDir, "minectl", "records")
+
+def encodeInt(value):
+    return -1 if value is None else int(value)
+
+def encodeFloat(value):
+    return math.nan if value is None else float(value)
+
+def decodeInt(value):
+    return None if value == -1 else value
+
+def decodeFloat(value):
+    return None if value != value else value
+
+# Appends samples to the newest segment in directory, starting a new segment once the current one is full or older than
+# rotateSeconds. The row count in the header is only bumped after a sample's rows are written, so readers never see a
+# half written sample.
+class MetricLogWriter:
+    def __init__(self, directory = None, rotateSeconds = 86400, capacity = 1 << 20):
+        self.directory = directory or getLogDir()
+        self.rotateSeconds = rotateSeconds
+        self.capacity = capacity
+        self.file = None
+        self.map = None
+        self.stringsFile = None
+        self.stringIds = {}
+        self.rows = 0
+        self.startTime = 0
+        self.segmentNumber = 0
+        self.offsets, self.fileSize = columnOffsets(capacity)
+        self.packers = [(self.offsets[name], struct.Struct("<" + fmt)) for name, fmt in columns]
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def openSegment(self, now):
+        self.close()
+
+        # Segments can rotate more than once a second, the sequence number keeps their names unique and in order. Never
+        # overwrites an existing segment, e.g. one left by an earlier process with the same pid.
+        prefix = "{}-{}".format(time.strftime("%Y%m%d-%H%M%S", time.localtime(now)), os.getpid())
+        while True:
+            self.segmentNumber += 1
+            path = os.path.join(self.directory, "{}-{:06d}.mlog".format(prefix, self.segmentNumber))
+            try:
+                self.file = open(path, "x+b")
+                break
+            except FileExistsError:
+                pass
+        self.file.truncate(self.fileSize)
+        self.map = mmap.mmap(self.file.fileno(), self.fileSize)
+        self.stringsFile = open(path + ".strings", "w", encoding="utf-8")
+        self.stringIds = {}
+        self.rows = 0
+        self.startTime = now
+        struct.pack_into(headerFormat, self.map, 0, magic, formatVersion, self.capacity, 0, now)
+
+    def stringId(self, value):
+        if value is None:
+            return -1
+
+        stringId = self.stringIds.get(value)
+        if stringId is None:
+            stringId = len(self.stringIds)
+            self.stringIds[value] = stringId
+            self.stringsFile.write(value.replace("\n", " ") + "\n")
+            self.stringsFile.flush()
+        return stringId
+
+    def append(self, minerName, stats, now = None):
+        if now is None:
+            now = time.time()
+        rowCount = 1 + len(stats["devices"])
+
+        if self.map is None or self.rows + rowCount > self.capacity or now - self.startTime >= self.rotateSeconds:
+            self.openSegment(now)
+
+        minerId = self.stringId(minerName)
+        rows = [(now, minerId, -1, encodeFloat(stats.get("hashrate")), encodeInt(stats.get("sharesAccepted")), encodeInt(stats.get("sharesRejected")),
+            encodeInt(stats.get("sharesFailed")), -1, -1, math.nan, encodeInt(stats.get("runtime")), encodeInt(stats.get("poolSwitches")), self.stringId(stats.get("activePool")))]
+        for i, device in enumerate(stats["devices"]):
+            rows.append((now, minerId, i, encodeFloat(device.get("hashrate")), encodeInt(device.get("accepted_shares")), encodeInt(device.get("rejected_shares")),
+                encodeInt(device.get("failed_shares", device.get("invalid_shares"))), encodeInt(device.get("core_temp")), encodeInt(device.get("fan")), encodeFloat(device.get("power")), -1, -1, -1))
+
+        for row in rows:
+            for (offset, packer), value in zip(self.packers, row):
+                packer.pack_into(self.map, offset + packer.size * self.rows, value)
+            self.rows += 1
+
+        struct.pack_into("<I", self.map, 12, self.rows)
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.stringsFile is not None:
+            self.stringsFile.close()
+            self.stringsFile = None
+
+# A read-only mapping of one segment, columns are memoryviews into the mapping so reading them copies nothing
+class MetricLogSegment:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fileMagic, version, self.capacity, self.rows, self.startTime = struct.unpack_from(headerFormat, self.map, 0)
+        if fileMagic != magic or version != formatVersion:
+            self.map.close()
+            raise RuntimeError("Not a metric log segment: {}".format(path))
+
+        offsets, fileSize = columnOffsets(self.capacity)
+        view = memoryview(self.map)
+        self.columns = {}
+        for name, fmt in columns:
+            self.columns[name] = view[offsets[name]:offsets[name] + struct.calcsize(fmt) * self.rows].cast(fmt)
+        view.release()
+
+        try:
+            with open(path + ".strings", "r", encoding="utf-8") as f:
+                self.strings = f.read().split("\n")
+        except FileNotFoundError:
+            self.strings = []
+
+    def string(self, stringId):
+        return self.strings[stringId] if 0 <= stringId < len(self.strings) else None
+
+    def endTime(self):
+        return self.columns["time"][self.rows - 1] if self.rows else self.startTime
+
+    # Row range [first, last) with start <= time < end, samples are appended in time order
+    def rowRange(self, start = None, end = None):
+        times = self.columns["time"]
+        first = bisect.bisect_left(times, start) if start is not None else 0
+        last = bisect.bisect_left(times, end) if end is not None else self.rows
+        return (first, last)
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.map.close()
+
+def listSegments(directory = None):
+    directory = directory or getLogDir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    return [os.path.join(directory, name) for name in sorted(names) if name.endswith(".mlog")]
+
+minerRowPattern = re.compile(b"\xff\xff")
+
+# Yields (time, minerName, MinerStats) for every recorded sample with start <= time < end, in recording order. The
+# wanted samples are picked out on the device and miner columns first, only their rows are decoded into objects.
+def readSamples(directory = None, start = None, end = None, minerNames = None):
+    for path in listSegments(directory):
+        segment = MetricLogSegment(path)
+        try:
+            if segment.rows == 0 or (end is not None and segment.startTime >= end) or (start is not None and segment.endTime() < start):
+                continue
+
+            first, last = segment.rowRange(start, end)
+            column = segment.columns
+
+            # A sample starts with its miner row (device -1, bytes ff ff) and runs until the next one. Searching the raw
+            # device column finds those rows without a Python step per row, device indices are never negative so ff ff
+            # only occurs at a row boundary as part of a -1.
+            with column["device"][first:last] as devices:
+                sampleStarts = [first + (match.start() >> 1) for match in minerRowPattern.finditer(devices.tobytes()) if not match.start() & 1]
+
+            if minerNames is None:
+                wantedStarts = sampleStarts
+            else:
+                wantedIds = {stringId for stringId, name in enumerate(segment.strings) if name in minerNames}
+                wantedStarts = list(itertools.compress(sampleStarts, map(wantedIds.__contains__, map(column["miner"].__getitem__, sampleStarts))))
+
+            for row in wantedStarts:
+                nextStart = bisect.bisect_right(sampleStarts, row)
+                sampleEnd = sampleStarts[nextStart] if nextStart < len(sampleStarts) else last
+
+                stats = MinerStats(
+                    runtime=decodeInt(column["runtime"][row]),
+                    hashrate=decodeFloat(column["hashrate"][row]),
+                    sharesAccepted=decodeInt(column["accepted"][row]),
+                    sharesRejected=decodeInt(column["rejected"][row]),
+                    sharesFailed=decodeInt(column["failed"][row]),
+                    activePool=segment.string(column["pool"][row]),
+                    poolSwitches=decodeInt(column["pool_switches"][row])
+                )
+
+                for deviceRow in range(row + 1, sampleEnd):
+                    stats.devices.append(DeviceStats(
+                        hashrate=decodeFloat(column["hashrate"][deviceRow]),
+                        accepted_shares=decodeInt(column["accepted"][deviceRow]),
+                        rejected_shares=decodeInt(column["rejected"][deviceRow]),
+                        failed_shares=decodeInt(column["failed"][deviceRow]),
+                        core_temp=decodeInt(column["core_temp"][deviceRow]),
+                        fan=decodeInt(column["fan"][deviceRow]),
+                        power=decodeFloat(column["power"][deviceRow])
+                    ))
+
+                yield (column["time"][row], segment.string(column["miner"][row]), stats)
+        finally:
+            segment.close()
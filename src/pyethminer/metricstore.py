@@ -0,0 +1,150 @@
+# Fixed-size in-memory time series of miner statistics
+# Author: Ziah Jyothi
+
+import array
+import math
+import time
+
+NAN = float("nan")
+
+# Ring buffers of the samples of one miner, all series share the timestamp buffer and write position. Memory is fixed
+# at capacity * (8 + 8 * len(minerMetrics) + 4 * len(deviceMetrics) * devices) bytes.
+class MinerSeries:
+    minerMetrics = ("hashrate", "sharesAccepted", "sharesRejected", "sharesFailed")
+    deviceMetrics = ("hashrate", "core_temp", "fan", "power")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.timestamps = array.array("d", [0.0]) * capacity
+        self.values = {metric: array.array("d", [NAN]) * capacity for metric in MinerSeries.minerMetrics}
+        self.deviceValues = []
+
+    def addDevice(self):
+        self.deviceValues.append({metric: array.array("f", [NAN]) * self.capacity for metric in MinerSeries.deviceMetrics})
+
+    def append(self, timestamp, stats):
+        i = self.head
+
+        self.timestamps[i] = timestamp
+        for metric in MinerSeries.minerMetrics:
+            value = stats.get(metric)
+            self.values[metric][i] = NAN if value is None else value
+
+        devices = stats.get("devices") or []
+        while len(self.deviceValues) < len(devices):
+            self.addDevice()
+
+        for idx, values in enumerate(self.deviceValues):
+            dev = devices[idx] if idx < len(devices) else {}
+            for metric in MinerSeries.deviceMetrics:
+                value = dev.get(metric)
+                values[metric][i] = NAN if value is None else value
+
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def physicalIndex(self, logicalIndex):
+        return (self.head - self.count + logicalIndex) % self.capacity
+
+    # Logical index of the oldest sample at or after since, found by binary search since timestamps only grow
+    def findStart(self, since):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self.physicalIndex(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def getValues(self, metric, device = None):
+        if device is None:
+            return self.values[metric]
+        if device >= len(self.deviceValues):
+            raise IndexError("No such device: {}".format(device))
+        return self.deviceValues[device][metric]
+
+    # Yields (timestamp, value) pairs oldest first for the last `seconds` seconds (all samples if None), skipping
+    # samples where the metric wasn't reported
+    def window(self, metric, device = None, seconds = None, now = None):
+        values = self.getValues(metric, device)
+        start = 0
+        if seconds is not None:
+            if now is None:
+                now = time.time()
+            start = self.findStart(now - seconds)
+
+        for logicalIndex in range(start, self.count):
+            i = self.physicalIndex(logicalIndex)
+            value = values[i]
+            if not math.isnan(value):
+                yield (self.timestamps[i], value)
+
+    def last(self, metric, device = None):
+        if self.count == 0:
+            return None
+
+        value = self.getValues(metric, device)[self.physicalIndex(self.count - 1)]
+        return None if math.isnan(value) else value
+
+    # Returns (min, max, mean) over the window, or None if there are no samples in it
+    def summary(self, metric, device = None, seconds = None, now = None):
+        count = 0
+        total = 0.0
+        minValue = math.inf
+        maxValue = -math.inf
+
+        for timestamp, value in self.window(metric, device, seconds, now):
+            count += 1
+            total += value
+            if value < minValue:
+                minValue = value
+            if value > maxValue:
+                maxValue = value
+
+        if count == 0:
+            return None
+
+        return (minValue, maxValue, total / count)
+
+    # Change per second between the oldest and newest sample in the window, or None with fewer than two samples
+    def rate(self, metric, device = None, seconds = None, now = None):
+        first = None
+        last = None
+        for sample in self.window(metric, device, seconds, now):
+            if first is None:
+                first = sample
+            last = sample
+
+        if first is None or last[0] == first[0]:
+            return None
+
+        return (last[1] - first[1]) / (last[0] - first[0])
+
+class MetricStore:
+    def __init__(self, capacity = 8640):
+        self.capacity = capacity
+        self.miners = {}
+
+    def record(self, minerName, stats, timestamp = None):
+        if stats is None:
+            return
+
+        series = self.miners.get(minerName)
+        if series is None:
+            series = MinerSeries(self.capacity)
+            self.miners[minerName] = series
+
+        if timestamp is None:
+            timestamp = time.time()
+        series.append(timestamp, stats)
+
+    def get(self, minerName):
+        return self.miners.get(minerName)
+
+    def remove(self, minerName):
+        self.miners.pop(minerName, None)
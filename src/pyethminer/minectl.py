@@ -1,86 +1,193 @@
 import sys
-import toml
-import colorama
-from pyethminer import EthminerApi
-from pyethminer import NBMinerApi
+import os
+import time
+import fnmatch
+
+# Backends, the TOML parser (only needed when the config cache is stale) and colorama are imported when a command first needs them to keep startup fast
+colorama = None
 
 configFile = "/etc/minectl.toml"
+daemonSocket = os.environ.get("MINECTL_SOCKET", "/run/minectl.sock")
+daemonTimeout = float(os.environ.get("MINECTL_DAEMON_TIMEOUT", 10))
 miners = {}
+minerOrder = {}
+minerIndex = {"tags": {}, "groups": {}}
+maxWorkers = 32
+keepConnections = False
+instrumentation = None
+rolloutFlags = {"--wave": int, "--parallel": int, "--max-failures": int, "--settle": float}
+rolloutOptions = {}
+# Errors that fail a single miner instead of the whole command. The API clients raise malformed replies as RuntimeError,
+# anything else is a bug and not hidden as a miner failure.
+minerErrors = (OSError, RuntimeError, ValueError)
+
+def initColors():
+    global colorama
 
-colorama.init()
+    if colorama is None:
+        import colorama
+        colorama.init()
 
 def loadConfig(configFile):
-    global miners
+    global miners, minerOrder, minerIndex, maxWorkers
+
+    from pyethminer import config as minerConfig
+
+    if keepConnections and miners:
+        return
 
     config = None
     try:
-        config = toml.load(configFile)
+        config = minerConfig.loadConfig(configFile)
     except FileNotFoundError as e:
         print("Configuration file not found: {}".format(e))
         sys.exit(1)
-
-    try:
-        for miner in config["miners"]:
-            miner["api"] = None
-            miner["pools"] = []
-            miner["activePool"] = None
-            miner["connectionError"] = False
-            miners[miner["name"]] = miner
     except RuntimeError as e:
         print("Failed to parse configuration: {}".format(e))
         sys.exit(1)
 
-def connectMiners(minerSelection):
+    maxWorkers = config["max_workers"]
+    minerIndex = config["index"]
+
+    for miner in config["miners"]:
+        miner["api"] = None
+        miner["pools"] = []
+        miner["activePool"] = None
+        miner["connectionError"] = False
+        minerOrder[miner["name"]] = len(miners)
+        miners[miner["name"]] = miner
+
+# Runs func with api.timeout temporarily set to timeout, so a tighter timeout for one request doesn't stick to the API
+# object and shorten the timeouts of commands sent later
+def withTimeout(api, timeout, func):
+    if timeout is None:
+        return func()
+
+    configuredTimeout = api.timeout
+    api.timeout = timeout
+    try:
+        return func()
+    finally:
+        api.timeout = configuredTimeout
+
+def connectMiner(miner, timeout = None):
+    if keepConnections and miner["api"] and miner["api"].connected:
+        miner["api"].instrumentation = instrumentation
+        return
+
+    miner["connectionError"] = False
+
+    if miner["api_type"] == "nbminer":
+        from pyethminer.nbminerapi import NBMinerApi
+        try:
+            miner["api"] = NBMinerApi()
+            miner["api"].instrumentation = instrumentation
+            miner["api"].label = miner["name"]
+            withTimeout(miner["api"], timeout, lambda: miner["api"].connect(miner["url"]))
+        except (OSError, RuntimeError) as e:
+            #print("Failed to connect to miner \"{}\": {}".format(miner["name"], e))
+            miner["api"] = None
+            miner["connectionError"] = True
+    elif miner["api_type"] == "ethminer":
+        from pyethminer.ethminerapi import EthminerApi
+        try:
+            miner["api"] = EthminerApi()
+            miner["api"].instrumentation = instrumentation
+            miner["api"].label = miner["name"]
+            withTimeout(miner["api"], timeout, lambda: miner["api"].connect(miner["host"], miner["port"]))
+        except (OSError, RuntimeError) as e:
+            #print("Failed to connect to miner \"{}\": {}".format(miner["name"], e))
+            miner["api"] = None
+            miner["connectionError"] = True
+    else:
+        print("Unknown miner API type: {}".format(miner["api_type"]))
+        #sys.exit(1)
+        miner["api"] = None
+        miner["connectionError"] = True
+
+def isGlob(pattern):
+    return any(c in pattern for c in "*?[")
+
+def matchNames(pattern, names):
+    if not isGlob(pattern):
+        return {pattern} if pattern in names else set()
+    return {name for name in names if fnmatch.fnmatchcase(name, pattern)}
+
+# A term is key=value (tag, value may be a glob, name=<glob> matches miner names) or a miner/group name or glob
+def matchSelectionTerm(term):
+    key, sep, value = term.partition("=")
+
+    if sep:
+        if key == "name":
+            return matchNames(value, miners)
+
+        tagIndex = minerIndex["tags"]
+        if not isGlob(value):
+            return set(tagIndex.get(term, ()))
+
+        matches = set()
+        for tag in matchNames(term, tagIndex):
+            matches.update(tagIndex[tag])
+        return matches
+
+    matches = matchNames(term, miners)
+    for group in matchNames(term, minerIndex["groups"]):
+        matches.update(minerIndex["groups"][group])
+    return matches
+
+# Resolves "all", a miner name or comma separated terms that must all match (e.g. site=dc2,model=3080 or rack-1*)
+# to miner names in config order
+def selectMiners(minerSelection):
     global miners
 
     if minerSelection == "all":
-        for miner in miners:
-            if miners[miner]["api_type"] == "nbminer":
-                try:
-                    miners[miner]["api"] = NBMinerApi()
-                    miners[miner]["api"].connect(miners[miner]["url"])
-                except (OSError, RuntimeError) as e:
-                    #print("Failed to connect to miner \"{}\": {}".format(miner, e))
-                    miners[miner]["api"] = None
-                    miners[miner]["connectionError"] = True
-            elif miners[miner]["api_type"] == "ethminer":
-                try:
-                    miners[miner]["api"] = EthminerApi()
-                    miners[miner]["api"].connect(miners[miner]["host"], miners[miner]["port"])
-                except (OSError, RuntimeError) as e:
-                    #print("Failed to connect to miner \"{}\": {}".format(miner, e))
-                    miners[miner]["api"] = None
-                    miners[miner]["connectionError"] = True
-            else:
-                print("Unknown miner API type: {}".format(miners[miner]["api_type"]))
-                #sys.exit(1)
-                miners[miner]["api"] = None
-                miners[miner]["connectionError"] = True
-    else:
-        if minerSelection not in miners:
-            print("No such miner: {}".format(minerSelection))
-            sys.exit(1)
-        if miners[minerSelection]["api_type"] == "nbminer":
-            try:
-                miners[minerSelection]["api"] = NBMinerApi()
-                miners[minerSelection]["api"].connect(miners[minerSelection]["url"])
-            except (OSError, RuntimeError) as e:
-                #print("Failed to connect to miner \"{}\": {}".format(minerSelection, e))
-                miners[minerSelection]["api"] = None
-                miners[minerSelection]["connectionError"] = True
-        elif miners[minerSelection]["api_type"] == "ethminer":
+        return list(miners)
+    if minerSelection in miners:
+        return [minerSelection]
+
+    selected = None
+    for term in minerSelection.split(","):
+        matches = matchSelectionTerm(term.strip())
+        selected = matches if selected is None else selected & matches
+
+    return sorted(selected, key=minerOrder.get)
+
+def connectMiners(minerSelection):
+    global miners
+
+    selection = selectMiners(minerSelection)
+    if len(selection) == 0:
+        print("No miners match selection: {}".format(minerSelection))
+        sys.exit(1)
+
+    forEachMiner(connectMiner, selection)
+
+    return selection
+
+# Runs func(miner) for every selected miner on a bounded thread pool so a fleet operation takes about as long as the
+# slowest miner instead of the sum of all of them. Returns {minerName: (result, error)} in selection order.
+def forEachMiner(func, selection, workers = None):
+    global miners
+
+    import concurrent.futures
+
+    results = {}
+    if len(selection) == 0:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers or maxWorkers, len(selection))) as executor:
+        futures = [(minerName, executor.submit(func, miners[minerName])) for minerName in selection]
+
+        for minerName, future in futures:
             try:
-                miners[minerSelection]["api"] = EthminerApi()
-                miners[minerSelection]["api"].connect(miners[minerSelection]["host"], miners[minerSelection]["port"])
-            except (OSError, RuntimeError) as e:
-                #print("Failed to connect to miner \"{}\": {}".format(minerSelection, e))
-                miners[minerSelection]["api"] = None
-                miners[minerSelection]["connectionError"] = True
-        else:
-            print("Unknown miner API type: {}".format(miners[minerSelection]["api_type"]))
-            #sys.exit(1)
-            miners[minerSelection]["api"] = None
-            miners[minerSelection]["connectionError"] = True
+                results[minerName] = (future.result(), None)
+            except minerErrors as e:
+                results[minerName] = (None, e)
+
+    return results
+
+def ethminerSelection(selection):
+    return [minerName for minerName in selection if miners[minerName]["api"] and miners[minerName]["api_type"] == "ethminer"]
 
 def listPools(miner):
     if miner["api_type"] != "ethminer":
@@ -98,12 +205,740 @@ def listPools(miner):
 
     return (pools, activePool)
 
+def parseRolloutOptions(argv):
+    remaining = []
+    options = {}
+
+    for arg in argv:
+        flag, _, value = arg.partition("=")
+        if flag not in rolloutFlags:
+            remaining.append(arg)
+            continue
+
+        try:
+            options[flag] = rolloutFlags[flag](value)
+        except ValueError:
+            print("Invalid value for {}: {}".format(flag, value))
+            sys.exit(1)
+
+    return (remaining, options)
+
+def createRollout():
+    from pyethminer.rollout import Rollout
+
+    parallel = rolloutOptions.get("--parallel", maxWorkers)
+
+    return Rollout(lambda func, names: forEachMiner(func, names, parallel), rolloutOptions.get("--wave", 0), rolloutOptions.get("--max-failures", 0), rolloutOptions.get("--settle", 0))
+
+# Runs a control command as a rollout, printing progress with describe(minerName, result) for applied changes.
+# Exits with 1 if the rollout was aborted.
+def runRollout(selection, action, apply, verify, rollback, describe):
+    rollout = createRollout()
+    reached = set()
+
+    def report(minerName, phase, result, error):
+        if phase == "apply":
+            reached.add(minerName)
+            if error:
+                print("Failed to {} on miner {}: {}".format(action, minerName, error))
+            else:
+                print(describe(minerName, result))
+        elif phase == "verify":
+            if error:
+                print("Verification failed on miner {}: {}".format(minerName, error))
+        elif phase == "rollback":
+            if error:
+                print("Failed to roll back miner {}: {}".format(minerName, error))
+            else:
+                print("Rolled back miner {}".format(minerName))
+
+    aborted, failures = rollout.run(selection, apply, verify, rollback, report)
+
+    if aborted:
+        print("Rollout aborted after {} failures, {} of {} miners not reached".format(len(failures), len(selection) - len(reached), len(selection)))
+        if not rollback:
+            print("Changes can't be rolled back automatically")
+        sys.exit(1)
+
+# Checks that the selected GPUs (all for gpuIndex -1) are hashing or not, only meaningful once the miner's hashrate
+# average has caught up with the change
+def verifyHashrate(miner, gpuIndex, hashing):
+    devices = miner["api"].getStats()["devices"]
+    for i, device in enumerate(devices):
+        if gpuIndex != -1 and i != gpuIndex:
+            continue
+        if (device["hashrate"] > 0) != hashing:
+            raise RuntimeError("GPU {} is {} ({:.2f}Mh/s)".format(i, "still hashing" if not hashing else "not hashing", device["hashrate"]))
+
 def printPools(pools, activePool):
     i = 0
     for pool in pools:
         print("{}[{}] {}".format("* " if i == activePool else "", i, pool))
         i = i + 1
 
+def formatStats(stats, separator = "\n"):
+    initColors()
+
+    hours, minutes = divmod(stats["runtime"] / 60, 60)
+
+    shareStr = "{}A{}{}".format(colorama.Fore.GREEN + colorama.Style.BRIGHT, stats["sharesAccepted"], colorama.Style.RESET_ALL)
+    if stats["sharesRejected"] > 0:
+        shareStr += " {}R{}{}".format(colorama.Fore.YELLOW + colorama.Style.BRIGHT, stats["sharesRejected"], colorama.Style.RESET_ALL)
+    if stats["sharesFailed"] > 0:
+        shareStr += " {}F{}{}".format(colorama.Fore.RED + colorama.Style.BRIGHT, stats["sharesFailed"], colorama.Style.RESET_ALL)
+
+    multiGpu = len(stats["devices"]) > 1
+
+    hashrateStr = ""
+
+    if stats["sharesAccepted"] != 0:
+        if stats["sharesRejected"] != 0:
+            hashrateStr += " {}R{:.2f}%{}".format(colorama.Fore.YELLOW + colorama.Style.BRIGHT, stats["sharesRejected"] / stats["sharesAccepted"] * 100, colorama.Style.RESET_ALL)
+
+        if stats["sharesFailed"] != 0:
+            hashrateStr += " {}F{:.2f}%{} ".format(colorama.Fore.RED + colorama.Style.BRIGHT, stats["sharesFailed"] / stats["sharesAccepted"] * 100, colorama.Style.RESET_ALL)
+
+    hashrateStr += "{}{}{:.2f}Mh/s{}".format(separator, colorama.Fore.CYAN + colorama.Style.BRIGHT, stats["hashrate"], colorama.Style.RESET_ALL)
+
+    if multiGpu:
+        hashrateStr += "  "
+        curGpu = 0
+        for dev in stats["devices"]:
+            if curGpu > 0:
+                hashrateStr += " "
+            hashrateStr += "{}{:.2f}Mh/s {}{}C{}".format(colorama.Fore.CYAN + colorama.Style.BRIGHT, dev["hashrate"], colorama.Style.RESET_ALL + colorama.Fore.RED, dev["core_temp"], colorama.Style.RESET_ALL)
+            curGpu += 1
+
+    return "{}{:02d}:{:02d}{} {} {}".format(colorama.Fore.CYAN, round(hours), round(minutes), colorama.Style.RESET_ALL, shareStr, hashrateStr)
+
+def formatDevice(device):
+    line = "GPU {} {}{}{}".format(device.get("index", "?"), colorama.Style.BRIGHT, device.get("name", ""), colorama.Style.RESET_ALL)
+    if "pci_bus_id" in device:
+        line += " {}".format(device["pci_bus_id"])
+    if "mode" in device:
+        line += " {}".format(device["mode"])
+    if "hashrate" in device:
+        line += " {}{:.2f}Mh/s{}".format(colorama.Fore.CYAN + colorama.Style.BRIGHT, device["hashrate"], colorama.Style.RESET_ALL)
+    if "accepted_shares" in device:
+        line += " A{} R{} F{}".format(device["accepted_shares"], device.get("rejected_shares", 0), device.get("failed_shares", 0))
+    if "core_temp" in device:
+        line += " {}{}C{}".format(colorama.Fore.RED, device["core_temp"], colorama.Style.RESET_ALL)
+    if "fan" in device:
+        line += " {}%".format(device["fan"])
+    if "power" in device:
+        line += " {}W".format(device["power"])
+    if "segment" in device:
+        line += " segment {:#x}-{:#x}".format(*device["segment"])
+    if device.get("paused"):
+        line += " {}paused{}{}".format(colorama.Fore.YELLOW + colorama.Style.BRIGHT, " ({})".format(device["pause_reason"]) if "pause_reason" in device else "", colorama.Style.RESET_ALL)
+    return line
+
+def formatDetailedStats(stats):
+    lines = ["{} on {} - {}".format(stats.get("version", "unknown version"), stats.get("hostname", "unknown host"), formatStats(stats, " "))]
+    poolInfo = []
+    if "activePool" in stats:
+        poolInfo.append("Pool {}{}".format(stats["activePool"], "" if stats.get("connected", True) else " (disconnected)"))
+    if "difficulty" in stats:
+        poolInfo.append("difficulty {}".format(stats["difficulty"]))
+    if "epoch" in stats:
+        poolInfo.append("epoch {}".format(stats["epoch"]))
+    if poolInfo:
+        lines.append(", ".join(poolInfo))
+    for device in stats["devices"]:
+        lines.append("  " + formatDevice(device))
+    return "\n".join(lines)
+
+def formatChange(value):
+    return "{:.2f}".format(value) if isinstance(value, float) else str(value)
+
+def formatDiff(changes):
+    parts = ["{} {} -> {}".format(field, formatChange(changes[field][0]), formatChange(changes[field][1])) for field in changes if field != "devices"]
+    for i, deviceChanges in changes.get("devices", {}).items():
+        parts.append("GPU {}: {}".format(i, ", ".join("{} {} -> {}".format(field, formatChange(old), formatChange(new)) for field, (old, new) in deviceChanges.items())))
+    return "; ".join(parts)
+
+# Prints the detailed stats of the selected miners once and from then on only the fields that changed, runs until
+# interrupted
+def diffDetailedStats(selection, interval):
+    global keepConnections
+
+    from pyethminer.stats import diffStats
+
+    keepConnections = True
+    previous = {}
+
+    try:
+        while True:
+            cycleStart = time.time()
+
+            forEachMiner(connectMiner, selection)
+            polled = [minerName for minerName in selection if miners[minerName]["api"]]
+            for minerName, (stats, error) in forEachMiner(lambda miner: miner["api"].getDetailedStats(), polled).items():
+                if error:
+                    print("[{}] Failed to get detailed statistics of miner {}: {}".format(time.strftime("%H:%M:%S"), minerName, error))
+                    continue
+
+                if minerName not in previous:
+                    print("-- Miner {} --".format(minerName))
+                    print(formatDetailedStats(stats))
+                else:
+                    changes = diffStats(previous[minerName], stats)
+                    if changes:
+                        print("[{}] {}: {}".format(time.strftime("%H:%M:%S"), minerName, formatDiff(changes)))
+                previous[minerName] = stats
+
+            sys.stdout.flush()
+            time.sleep(max(0.1, interval - (time.time() - cycleStart)))
+    except KeyboardInterrupt:
+        pass
+
+def pollStats(miner):
+    if not miner["api"]:
+        return None
+
+    start = time.time()
+    stats = miner["api"].getStats()
+    return (stats, time.time() - start)
+
+# Like pollStats, but ethminers are asked for their detailed stats, which also say which GPUs are paused
+def pollDetailedStats(miner):
+    if not miner["api"] or miner["api_type"] != "ethminer":
+        return pollStats(miner)
+
+    start = time.time()
+    stats = miner["api"].getDetailedStats()
+    return (stats, time.time() - start)
+
+# Reconnects dropped miners and polls stats from all of them, returns {minerName: (stats, pollSeconds)} with None for
+# miners that couldn't be polled. With a scheduler only the miners that are due get polled, using timeouts derived from
+# their RTT, and miners whose circuit is open are probed with a ping first.
+def pollFleet(selection, scheduler = None, poll = pollStats):
+    if scheduler is None:
+        forEachMiner(connectMiner, selection)
+
+        return {minerName: result for minerName, (result, error) in forEachMiner(poll, selection).items()}
+
+    def pollScheduled(miner):
+        minerName = miner["name"]
+        timeout = scheduler.timeoutFor(minerName)
+
+        try:
+            connectMiner(miner, timeout)
+            if not miner["api"]:
+                raise ConnectionError("Failed to connect to miner")
+
+            def probeAndPoll():
+                if scheduler.isOpen(minerName) and miner["api_type"] == "ethminer":
+                    miner["api"].ping()
+
+                return poll(miner)
+
+            result = withTimeout(miner["api"], timeout, probeAndPoll)
+        except minerErrors:
+            scheduler.recordFailure(minerName)
+            raise
+
+        scheduler.recordSuccess(minerName, result[1])
+        return result
+
+    due = scheduler.due(selection)
+
+    return {minerName: result for minerName, (result, error) in forEachMiner(pollScheduled, due).items()}
+
+def createScheduler(selection, interval):
+    from pyethminer.scheduler import PollScheduler
+
+    scheduler = PollScheduler(interval)
+    for minerName in selection:
+        if "poll_interval" in miners[minerName]:
+            scheduler.setInterval(minerName, miners[minerName]["poll_interval"])
+
+    return scheduler
+
+# Mean hashrate and accepted shares per hour over the last window seconds of a miner's series
+def formatTrend(series, window, now):
+    summary = series.summary("hashrate", seconds=window, now=now)
+    if summary is None:
+        return ""
+
+    trend = " {}{}m {:.2f}Mh/s".format(colorama.Style.DIM, round(window / 60), summary[2])
+    shareRate = series.rate("sharesAccepted", seconds=window, now=now)
+    # A negative rate means the miner restarted within the window
+    if shareRate is not None and shareRate >= 0:
+        trend += " {:.1f}A/h".format(shareRate * 3600)
+    return trend + colorama.Style.RESET_ALL
+
+# Rewrites only the lines that differ from the previous frame at absolute positions, lines that don't fit on the terminal
+# are cut off and the screen is cleared when the number of lines changes. Returns the frame as drawn.
+def redrawLines(oldLines, newLines):
+    import shutil
+
+    initColors()
+
+    rows = shutil.get_terminal_size().lines
+    if len(newLines) > rows:
+        newLines = newLines[:rows - 1] + ["{}{} more lines, enlarge the terminal to see them{}".format(colorama.Style.DIM, len(newLines) - rows + 1, colorama.Style.RESET_ALL)]
+
+    output = []
+    if len(oldLines) != len(newLines):
+        output.append(colorama.Cursor.POS(1, 1) + colorama.ansi.clear_screen())
+        oldLines = []
+
+    for i, line in enumerate(newLines):
+        if i >= len(oldLines) or line != oldLines[i]:
+            output.append(colorama.Cursor.POS(1, i + 1) + colorama.ansi.clear_line() + line)
+
+    sys.stdout.write("".join(output))
+    sys.stdout.flush()
+
+    return newLines
+
+def watchMiners(selection, interval):
+    global keepConnections
+
+    initColors()
+
+    import shutil
+    from pyethminer.metricstore import MetricStore
+
+    keepConnections = True
+    scheduler = createScheduler(selection, interval)
+
+    # Only keep as many samples as the trend window needs at the shortest poll interval
+    trendWindow = 900
+    store = MetricStore(int(trendWindow / min(scheduler.getState(minerName).interval for minerName in selection)) + 2)
+
+    lastStats = {}
+    lastUpdate = {}
+    latencies = {}
+    lines = []
+    lastTerminalSize = None
+    nameWidth = max(len(minerName) for minerName in selection)
+
+    # Draw on the alternate screen so the shell's scrollback is left alone, and disable line wrapping so long lines
+    # don't shift the rows below them
+    sys.stdout.write("\x1b[?1049h\x1b[?7l")
+    try:
+        while True:
+            cycleStart = time.time()
+
+            for minerName, result in pollFleet(selection, scheduler).items():
+                if result is None:
+                    continue
+
+                lastStats[minerName], latencies[minerName] = result
+                lastUpdate[minerName] = time.time()
+                store.record(minerName, lastStats[minerName], lastUpdate[minerName])
+
+            now = time.time()
+            up = 0
+            newLines = []
+
+            for minerName in selection:
+                line = "{}{:<{}}{} ".format(colorama.Fore.WHITE + colorama.Style.BRIGHT, minerName, nameWidth, colorama.Style.RESET_ALL)
+
+                if minerName not in lastStats:
+                    line += "{}Connection Error{}".format(colorama.Fore.RED, colorama.Style.RESET_ALL)
+                else:
+                    stale = now - lastUpdate[minerName] > scheduler.getState(minerName).interval
+                    if stale:
+                        line += "{}stale {:>4d}s{} ".format(colorama.Fore.RED + colorama.Style.BRIGHT, round(now - lastUpdate[minerName]), colorama.Style.RESET_ALL)
+                    else:
+                        line += "{}{:>5d}ms{} ".format(colorama.Style.DIM, round(latencies[minerName] * 1000), colorama.Style.RESET_ALL)
+                        up += 1
+                    line += formatStats(lastStats[minerName], " ") + formatTrend(store.get(minerName), trendWindow, now)
+
+                newLines.append(line)
+
+            newLines.insert(0, "{}minectl watch{} - {}/{} miners up - {}".format(colorama.Style.BRIGHT, colorama.Style.RESET_ALL, up, len(selection), time.strftime("%H:%M:%S")))
+
+            # Start over after a resize, the terminal may have moved or cut off lines
+            terminalSize = shutil.get_terminal_size()
+            if terminalSize != lastTerminalSize:
+                lines = []
+                lastTerminalSize = terminalSize
+
+            lines = redrawLines(lines, newLines)
+
+            # Redraw at least once per interval so stale miners are shown as such, but wake up earlier for miners with
+            # shorter intervals
+            time.sleep(max(0.1, min(scheduler.nextDeadline(selection), cycleStart + interval) - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout.write("\x1b[?7h\x1b[?1049l")
+        sys.stdout.flush()
+
+# Moves miners off degraded pools, runs until interrupted
+def failoverMiners(selection, interval, dryRun):
+    global keepConnections
+
+    from pyethminer.failover import PoolFailover, probePool
+
+    keepConnections = True
+    scheduler = createScheduler(selection, interval)
+    failover = PoolFailover()
+
+    def log(message):
+        print("[{}] {}".format(time.strftime("%H:%M:%S"), message), flush=True)
+
+    def failoverMiner(miner):
+        pools = miner["api"].getPools()
+        activeIndex = next((pool["index"] for pool in pools if pool["active"]), None)
+        latencies = {pool["index"]: probePool(pool) for pool in pools if not pool["active"]}
+
+        target = failover.chooseAlternative(miner["name"], pools, latencies)
+        if target is not None:
+            if not dryRun:
+                miner["api"].setActivePool(target)
+            failover.recordSwitch(miner["name"], activeIndex, target)
+
+        return (pools, activeIndex, target)
+
+    log("Watching pools of {} miners{}".format(len(selection), " (dry run)" if dryRun else ""))
+    try:
+        while True:
+            cycleStart = time.time()
+
+            degraded = {}
+            for minerName, result in pollFleet(selection, scheduler).items():
+                if result is None:
+                    continue
+
+                failover.addSample(minerName, result[0])
+                reason = failover.check(minerName)
+                if reason:
+                    degraded[minerName] = reason
+
+            for minerName, (result, error) in forEachMiner(failoverMiner, list(degraded)).items():
+                if error:
+                    log("Miner {}: {}, failed to fail over: {}".format(minerName, degraded[minerName], error))
+                    continue
+
+                pools, activeIndex, target = result
+                if target is None:
+                    log("Miner {}: {}, no healthy alternative pool".format(minerName, degraded[minerName]))
+                else:
+                    log("Miner {}: {}, {} pool {} -> {} ({}://{}:{})".format(minerName, degraded[minerName], "would switch" if dryRun else "switched",
+                        activeIndex, target, pools[target]["scheme"], pools[target]["host"], pools[target]["port"]))
+
+            time.sleep(max(0.1, min(scheduler.nextDeadline(selection), cycleStart + interval) - time.time()))
+    except KeyboardInterrupt:
+        pass
+
+# Watches device hashrate and temperature for anomalies and remediates them with action ("report", "pause" to pause the
+# affected GPUs for pauseTime seconds or "restart"), runs until interrupted. Only ethminer miners can be remediated.
+def guardMiners(selection, interval, action, pauseTime):
+    global keepConnections
+
+    from pyethminer.anomaly import AnomalyDetector
+
+    keepConnections = True
+    scheduler = createScheduler(selection, interval)
+    detector = AnomalyDetector()
+    # minerName -> (resume time, GPU indices)
+    pausedGpus = {}
+
+    def log(message):
+        print("[{}] {}".format(time.strftime("%H:%M:%S"), message), flush=True)
+
+    def remediate(miner, gpuIndices):
+        if action == "restart":
+            miner["api"].restart()
+            return "restarted miner"
+
+        for gpuIndex in gpuIndices:
+            miner["api"].pauseGpu(gpuIndex, True)
+        pausedGpus[miner["name"]] = (time.time() + pauseTime, gpuIndices)
+        return "paused GPU {} for {}s".format(",".join(str(gpuIndex) for gpuIndex in gpuIndices), round(pauseTime))
+
+    def resume(miner):
+        for gpuIndex in pausedGpus[miner["name"]][1]:
+            miner["api"].pauseGpu(gpuIndex, False)
+
+    # GPUs that fail to resume stay in pausedGpus and are tried again an interval later
+    def resumeGpus(minerNames):
+        for minerName, (result, error) in forEachMiner(resume, minerNames).items():
+            gpuList = ",".join(str(gpuIndex) for gpuIndex in pausedGpus[minerName][1])
+            if error:
+                log("Miner {}: failed to resume GPU {}: {}".format(minerName, gpuList, error))
+                pausedGpus[minerName] = (time.time() + interval, pausedGpus[minerName][1])
+            else:
+                log("Miner {}: resumed GPU {}".format(minerName, gpuList))
+                del pausedGpus[minerName]
+
+    log("Watching {} miners for anomalies, remediation: {}".format(len(selection), action))
+    try:
+        while True:
+            cycleStart = time.time()
+
+            resumeGpus([minerName for minerName, (resumeTime, gpuIndices) in pausedGpus.items() if resumeTime <= cycleStart])
+
+            remediations = {}
+            # Detailed stats say which GPUs are paused, the detector skips those so GPUs paused by the operator don't
+            # look like failed GPUs
+            for minerName, result in pollFleet(selection, scheduler, pollDetailedStats).items():
+                if result is None:
+                    continue
+
+                anomalies = detector.update(minerName, result[0])
+                for gpuIndex, kind, description in anomalies:
+                    log("Miner {}{}: {}".format(minerName, " GPU {}".format(gpuIndex) if gpuIndex != -1 else "", description))
+
+                gpuIndices = sorted({gpuIndex for gpuIndex, kind, description in anomalies if gpuIndex != -1})
+                if not anomalies or action == "report" or miners[minerName]["api_type"] != "ethminer" or (action == "pause" and not gpuIndices) or minerName in pausedGpus:
+                    continue
+
+                if not detector.allowAction(minerName):
+                    log("Miner {}: remediation rate limited".format(minerName))
+                    continue
+
+                detector.recordAction(minerName)
+                remediations[minerName] = gpuIndices
+
+            for minerName, (result, error) in forEachMiner(lambda miner: remediate(miner, remediations[miner["name"]]), list(remediations)).items():
+                if error:
+                    log("Miner {}: remediation failed: {}".format(minerName, error))
+                else:
+                    log("Miner {}: {}".format(minerName, result))
+
+            nextWake = min(scheduler.nextDeadline(selection), cycleStart + interval, *(resumeTime for resumeTime, gpuIndices in pausedGpus.values()))
+            time.sleep(max(0.1, nextWake - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Don't leave GPUs paused by the guard behind
+        if pausedGpus:
+            resumeGpus(list(pausedGpus))
+
+# Returns the LHR tune store keys of the miner's GPUs
+def identifyGpus(miner):
+    from pyethminer.lhrtune import deviceKeys
+
+    stats = miner["api"].getStats()
+    try:
+        detail = miner["api"].getDetailedStats()
+    except RuntimeError:
+        detail = None
+
+    return deviceKeys(miner["name"], stats, detail)
+
+# Searches the best LHR tune of the selected GPUs (all for gpuIndex -1) of every selected miner at the same time. Each
+# round sets every GPU's next candidate tune, waits settleTime for the hashrate to settle and takes the median of
+# samples readings sampleInterval apart. The best tunes are applied and saved at the end, also when interrupted.
+def tuneLhrMiners(selection, gpuIndex, low, high, step, settleTime, samples, sampleInterval):
+    from pyethminer.lhrtune import TuneSearch, TuneStore
+
+    store = TuneStore()
+    # (minerName, GPU index) -> (store key, search)
+    searches = {}
+    # (minerName, GPU index) -> saved tune or None
+    startTunes = {}
+
+    for minerName, (keys, error) in forEachMiner(identifyGpus, selection).items():
+        if error:
+            print("Failed to get GPUs of miner {}: {}".format(minerName, error))
+            continue
+
+        for i, key in enumerate(keys):
+            if gpuIndex != -1 and i != gpuIndex:
+                continue
+
+            saved = store.get(key)
+            start = saved["tune"] if saved else (low + high) // 2
+            searches[(minerName, i)] = (key, TuneSearch(start, low, high, step))
+            startTunes[(minerName, i)] = saved["tune"] if saved else None
+
+    def setTunes(tunes):
+        byMiner = {}
+        for (minerName, i), tune in tunes.items():
+            byMiner.setdefault(minerName, []).append((i, tune))
+
+        def setMinerTunes(miner):
+            for i, tune in byMiner[miner["name"]]:
+                miner["api"].setLhrTune(i, tune)
+
+        return forEachMiner(setMinerTunes, list(byMiner))
+
+    # GPUs whose tune was changed, whatever happens they get the best tune found or the one they started with
+    tunedGpus = set()
+    try:
+        while True:
+            candidates = {gpu: search.candidate() for gpu, (key, search) in searches.items() if not search.done}
+            if not candidates:
+                break
+
+            tunedGpus.update(candidates)
+            for minerName, (result, error) in setTunes(candidates).items():
+                if error:
+                    print("Failed to set LHR tune on miner {}, giving up on it: {}".format(minerName, error))
+                    for (gpuMiner, i), (key, search) in searches.items():
+                        if gpuMiner == minerName:
+                            search.done = True
+
+            time.sleep(settleTime)
+
+            readings = {gpu: [] for gpu in candidates}
+            tunedMiners = sorted({minerName for minerName, i in candidates})
+            for sample in range(samples):
+                if sample > 0:
+                    time.sleep(sampleInterval)
+
+                for minerName, (stats, error) in forEachMiner(lambda miner: miner["api"].getStats(), tunedMiners).items():
+                    if error:
+                        continue
+                    for i, device in enumerate(stats["devices"]):
+                        if (minerName, i) in readings:
+                            readings[(minerName, i)].append(device["hashrate"])
+
+            for (minerName, i), values in readings.items():
+                key, search = searches[(minerName, i)]
+                if search.done:
+                    continue
+                if not values:
+                    print("No hashrate readings for GPU {} on miner {}, giving up on it".format(i, minerName))
+                    search.done = True
+                    continue
+
+                values.sort()
+                hashrate = values[len(values) // 2]
+                outcome = search.report(hashrate)
+                print("Miner {} GPU {}: tune {} -> {:.2f}Mh/s ({}, best {} at {:.2f}Mh/s)".format(minerName, i, candidates[(minerName, i)], hashrate, outcome, search.best, search.bestHashrate), flush=True)
+    except KeyboardInterrupt:
+        print("Interrupted, applying the best LHR tunes found so far")
+    finally:
+        final = {}
+        for gpu in tunedGpus:
+            key, search = searches[gpu]
+            if search.best is not None:
+                final[gpu] = search.best
+            elif startTunes[gpu] is not None:
+                final[gpu] = startTunes[gpu]
+
+        for minerName, (result, error) in setTunes(final).items():
+            if error:
+                print("Failed to apply the best LHR tunes on miner {}: {}".format(minerName, error))
+
+        for (minerName, i), (key, search) in searches.items():
+            if search.best is None:
+                continue
+
+            store.set(key, search.best, search.bestHashrate)
+            print("Best LHR tune for GPU {} on miner {}: {} ({:.2f}Mh/s)".format(i, minerName, search.best, search.bestHashrate))
+
+        store.save()
+
+# Streams changes of the selected miners' stats as NDJSON events to stdout or, with socketPath, to every client of a
+# Unix socket, runs until interrupted
+def streamChanges(selection, interval, thresholds, socketPath):
+    global keepConnections
+
+    from pyethminer.changefeed import ChangeFeed, FeedServer, encodeEvent
+
+    keepConnections = True
+    scheduler = createScheduler(selection, interval)
+    feed = ChangeFeed(thresholds)
+
+    server = None
+    if socketPath:
+        server = FeedServer(socketPath, feed)
+        server.start()
+
+    try:
+        while True:
+            cycleStart = time.time()
+
+            results = [(minerName, result[0] if result else None) for minerName, result in pollFleet(selection, scheduler).items()]
+
+            if server:
+                server.update(results)
+            else:
+                events = []
+                for minerName, stats in results:
+                    events += feed.update(minerName, stats)
+
+                if events:
+                    sys.stdout.buffer.write(b"".join(encodeEvent(event) for event in events))
+                    sys.stdout.flush()
+
+            time.sleep(max(0.1, min(scheduler.nextDeadline(selection), cycleStart + interval) - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.close()
+
+# Appends every poll of the selected miners to the metric log, runs until interrupted
+def recordMiners(selection, interval, directory, rotateSeconds):
+    global keepConnections
+
+    from pyethminer.metriclog import MetricLogWriter
+
+    keepConnections = True
+    scheduler = createScheduler(selection, interval)
+    writer = MetricLogWriter(directory, rotateSeconds)
+
+    print("Recording {} miners to {}".format(len(selection), writer.directory), flush=True)
+    try:
+        while True:
+            cycleStart = time.time()
+
+            for minerName, result in pollFleet(selection, scheduler).items():
+                if result is not None:
+                    writer.append(minerName, result[0])
+
+            time.sleep(max(0.1, min(scheduler.nextDeadline(selection), cycleStart + interval) - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+# Unix timestamps, ISO 8601 dates/times or an age like 30m, 12h or 7d
+def parseTime(value):
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units:
+        try:
+            return time.time() - float(value[:-1].lstrip("-")) * units[value[-1]]
+        except ValueError:
+            pass
+
+    try:
+        return float(value)
+    except ValueError:
+        import datetime
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+# Feeds recorded samples through the same paths as live polls: status lines, the change feed (mode "feed") or the
+# anomaly detector (mode "anomalies")
+def replayRecords(minerNames, start, end, directory, mode, thresholds):
+    from pyethminer.metriclog import readSamples
+
+    initColors()
+
+    def timestamp(sampleTime):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sampleTime))
+
+    if mode == "feed":
+        from pyethminer.changefeed import ChangeFeed, encodeEvent
+
+        feed = ChangeFeed(thresholds)
+        for sampleTime, minerName, stats in readSamples(directory, start, end, minerNames):
+            events = feed.update(minerName, stats, sampleTime)
+            if events:
+                sys.stdout.buffer.write(b"".join(encodeEvent(event) for event in events))
+    elif mode == "anomalies":
+        from pyethminer.anomaly import AnomalyDetector
+
+        detector = AnomalyDetector()
+        for sampleTime, minerName, stats in readSamples(directory, start, end, minerNames):
+            for gpuIndex, kind, description in detector.update(minerName, stats, sampleTime):
+                print("[{}] Miner {}{}: {}".format(timestamp(sampleTime), minerName, " GPU {}".format(gpuIndex) if gpuIndex != -1 else "", description))
+    else:
+        for sampleTime, minerName, stats in readSamples(directory, start, end, minerNames):
+            print("{} {}{}{} {}".format(timestamp(sampleTime), colorama.Fore.WHITE + colorama.Style.BRIGHT, minerName, colorama.Style.RESET_ALL, formatStats(stats, " ")))
+
+    sys.stdout.flush()
+
 def printHelp():
     print("""minectl help
 ------------
@@ -116,16 +951,64 @@ Commands:
   pause/resume [miner (default: all)] [gpu index (default: 0)] - Pauses or resumes mining on a GPU
   pools [miner (default: all)] - Lists pools
   pool [miner (default: all)] <pool index> - Sets the active pool
-  lhr [miner (default: all)] <tune> - Sets the LHR tune value for a miner""".format(configFile))
+  lhr [miner (default: all)] <tune> - Sets the LHR tune value for a miner
+  watch [miner (default: all)] [interval (default: 5)] - Live status of miners, redrawn as values change
+  exporter [[address]:port (default: :9910)] [interval (default: 15)] - Serve Prometheus metrics of all miners
+  failover [miner (default: all)] [interval (default: 30)] [--dry-run] - Switch miners off pools with too many
+    rejected/failed shares or no accepted shares
+  detail [miner (default: all)] [--diff[=interval (default: 5)]] - Detailed per GPU statistics, with --diff keep
+    polling and only print what changed
+  feed [miner (default: all)] [interval (default: 5)] [--socket=PATH] [--threshold=FIELD>VALUE ...] - Stream
+    changes (shares, pool switches, devices, threshold crossings) as NDJSON to stdout or a Unix socket
+  record [miner (default: all)] [interval (default: 10)] [--dir=PATH] [--rotate=SECONDS (default: 86400)] - Record
+    stats of miners to an on-disk log
+  replay [miner (default: all)] [--from=TIME] [--to=TIME] [--dir=PATH] [--feed [--threshold=...]] [--anomalies] -
+    Print recorded stats, or run them through the change feed or anomaly detection. TIME is a timestamp, an ISO
+    date/time or an age like 12h or 7d
+  lhrtune [miner (default: all)] [gpu index (default: all)] [--low=N] [--high=N] [--step=N] [--settle=SECONDS]
+    [--samples=N] [--sample-interval=SECONDS] - Search the best LHR tune of each GPU and save it
+  lhrapply [miner (default: all)] - Apply the saved best LHR tunes, e.g. after a reboot
+  guard [miner (default: all)] [interval (default: 10)] [--action=report|pause|restart] [--pause-time=SECONDS] -
+    Report GPUs whose hashrate drops or temperature spikes and optionally pause them or restart the miner
 
-def main():
-    global miners
+Add --timings to any command to print per miner, method and phase (connect, send, wait, parse) request timings.
+
+pause, resume, pool and lhr roll out in waves and verify each wave before starting the next:
+  --wave=N          Miners per wave (default: all at once)
+  --parallel=N      Miners changed concurrently (default: max_workers)
+  --settle=SECONDS  Wait before verifying and also check the hashrate recovered (default: 0)
+  --max-failures=N  Abort and roll back once more than N miners failed, -1 for never (default: 0)
+
+Miner selection:
+  all, a miner name, a group name, a glob on names/groups (rack-1*) or tag=value (site=dc2, backend=nbminer,
+  model=30*). Comma separated terms must all match: site=dc2,model=3080""".format(configFile))
+
+def runCommand(argv):
+    global miners, keepConnections, instrumentation, rolloutOptions
+
+    instrumentation = None
+    if "--timings" in argv:
+        from pyethminer.instrumentation import Instrumentation
+        instrumentation = Instrumentation()
+        argv = [arg for arg in argv if arg != "--timings"]
+
+    argv, rolloutOptions = parseRolloutOptions(argv)
 
-    if len(sys.argv) < 2:
-        print("Usage: {} <command> [command args]".format(sys.argv[0]))
+    try:
+        runMinerCommand(argv)
+    finally:
+        if instrumentation:
+            print()
+            print(instrumentation.report())
+
+def runMinerCommand(argv):
+    global miners, keepConnections
+
+    if len(argv) < 2:
+        print("Usage: {} <command> [command args]".format(argv[0]))
         sys.exit(1)
 
-    command = sys.argv[1]
+    command = argv[1]
 
     if command == "help":
         printHelp()
@@ -136,29 +1019,21 @@ def main():
 --------------
 miners = [
     { name = "local", host = "localhost", port = 3333 },
-    { name = "remote", host = "10.0.0.123", port = 3333 }
+    { name = "remote", host = "10.0.0.123", port = 3333, groups = ["rack-1"], tags = { site = "dc2", model = "3080" }, poll_interval = 30 }
 ]""")
         return
 
     elif command == "status" or command == "statistics" or command == "stats":
+        initColors()
         loadConfig(configFile)
-        connectMiners(sys.argv[2] if len(sys.argv) >= 3 else "all")
+        selection = connectMiners(argv[2] if len(argv) >= 3 else "all")
 
         minerStats = {}
 
-        for minerName in miners:
-            miner = miners[minerName]
-            if not miner["api"]:
-                if miner["connectionError"]:
-                    minerStats[minerName] = None
-
-                continue
-
-            try:
-                minerStats[minerName] = miner["api"].getStats()
-            except (OSError, RuntimeError) as e:
-                #print("Failed to connect to miner {}: {}".format(minerName, e))
-                minerStats[minerName] = None
+        for minerName, (stats, error) in forEachMiner(lambda miner: miner["api"].getStats() if miner["api"] else None, selection).items():
+            #if error:
+                #print("Failed to connect to miner {}: {}".format(minerName, error))
+            minerStats[minerName] = stats
 
         minerStatsLen = len(minerStats)
         i = 0
@@ -170,37 +1045,7 @@ miners = [
             statsStr = "{}Miner {}{} - ".format(colorama.Fore.WHITE + colorama.Style.BRIGHT, minerName, colorama.Style.RESET_ALL) if minerStatsLen > 1 else ""
 
             if stats is not None:
-                hours, minutes = divmod(stats["runtime"] / 60, 60)
-
-                shareStr = "{}A{}{}".format(colorama.Fore.GREEN + colorama.Style.BRIGHT, stats["sharesAccepted"], colorama.Style.RESET_ALL)
-                if stats["sharesRejected"] > 0:
-                    shareStr += " {}R{}{}".format(colorama.Fore.YELLOW + colorama.Style.BRIGHT, stats["sharesRejected"], colorama.Style.RESET_ALL)
-                if stats["sharesFailed"] > 0:
-                    shareStr += " {}F{}{}".format(colorama.Fore.RED + colorama.Style.BRIGHT, stats["sharesFailed"], colorama.Style.RESET_ALL)
-
-                multiGpu = len(stats["devices"]) > 1
-
-                hashrateStr = ""
-
-                if stats["sharesAccepted"] != 0:
-                    if stats["sharesRejected"] != 0:
-                        hashrateStr += " {}R{:.2f}%{}".format(colorama.Fore.YELLOW + colorama.Style.BRIGHT, stats["sharesRejected"] / stats["sharesAccepted"] * 100, colorama.Style.RESET_ALL)
-
-                    if stats["sharesFailed"] != 0:
-                        hashrateStr += " {}F{:.2f}%{} ".format(colorama.Fore.RED + colorama.Style.BRIGHT, stats["sharesFailed"] / stats["sharesAccepted"] * 100, colorama.Style.RESET_ALL)
-
-                hashrateStr += "\n{}{:.2f}Mh/s{}".format(colorama.Fore.CYAN + colorama.Style.BRIGHT, stats["hashrate"], colorama.Style.RESET_ALL)
-
-                if multiGpu:
-                    hashrateStr += "  "
-                    curGpu = 0
-                    for dev in stats["devices"]:
-                        if curGpu > 0:
-                            hashrateStr += " "
-                        hashrateStr += "{}{:.2f}Mh/s {}{}C{}".format(colorama.Fore.CYAN + colorama.Style.BRIGHT, dev["hashrate"], colorama.Style.RESET_ALL + colorama.Fore.RED, dev["core_temp"], colorama.Style.RESET_ALL)
-                        curGpu += 1
-
-                statsStr += "{}{:02d}:{:02d}{} {} {}".format(colorama.Fore.CYAN, round(hours), round(minutes), colorama.Style.RESET_ALL, shareStr, hashrateStr)
+                statsStr += formatStats(stats)
             else:
                 statsStr += "Connection Error"
 
@@ -216,106 +1061,404 @@ miners = [
 
         minerSelection = "all"
         gpuIndex = -1
-        if len(sys.argv) >= 4:
-            minerSelection = sys.argv[2]
-            gpuIndex = int(sys.argv[3])
-        elif len(sys.argv) >= 3:
-            minerSelection = sys.argv[2]
+        if len(argv) >= 4:
+            minerSelection = argv[2]
+            gpuIndex = int(argv[3])
+        elif len(argv) >= 3:
+            minerSelection = argv[2]
 
         loadConfig(configFile)
-        connectMiners(minerSelection)
+        selection = ethminerSelection(connectMiners(minerSelection))
 
-        for minerName in miners:
-            miner = miners[minerName]
-            if not miner["api"] or miner["api_type"] != "ethminer":
-                continue
+        # Remembers which of the GPUs were paused before, so a rollback puts each one back the way it was instead of
+        # resuming GPUs that were paused on purpose
+        def applyPause(miner):
+            devices = miner["api"].getDetailedStats()["devices"]
+            wasPaused = {device["index"]: bool(device.get("paused")) for device in devices if device.get("index") is not None and (gpuIndex == -1 or device["index"] == gpuIndex)}
 
+            # The detailed stats already list every GPU, so pausing all of them doesn't need another getStats first
+            miner["api"].updateTopology(len(devices))
             miner["api"].pauseGpu(gpuIndex, pause)
+            return wasPaused
+
+        def rollbackPause(miner, wasPaused):
+            for index, paused in wasPaused.items():
+                if paused != pause:
+                    miner["api"].pauseGpu(index, paused)
+
+        def verifyPause(miner):
+            devices = miner["api"].getDetailedStats()["devices"]
+            targeted = [device for device in devices if device.get("index") is not None and (gpuIndex == -1 or device["index"] == gpuIndex)]
+            if not targeted:
+                raise RuntimeError("no GPUs found" if gpuIndex == -1 else "GPU {} not found".format(gpuIndex))
+            for device in targeted:
+                if bool(device.get("paused")) != pause:
+                    raise RuntimeError("GPU {} is {}".format(device["index"], "not paused" if pause else "still paused"))
+
+            # The hashrate average only moves after a while, so it's only checked with a settle time
+            if rolloutOptions.get("--settle", 0) > 0:
+                verifyHashrate(miner, gpuIndex, not pause)
+
+        def describePause(minerName, result):
             if gpuIndex == -1:
-                print("{} all GPUs on miner {}".format("Paused" if pause else "Resumed", minerName))
-            else:
-                print("{} GPU {} on miner {}".format("Paused" if pause else "Resumed", gpuIndex, minerName))
+                return "{} all GPUs on miner {}".format("Paused" if pause else "Resumed", minerName)
+            return "{} GPU {} on miner {}".format("Paused" if pause else "Resumed", gpuIndex, minerName)
+
+        runRollout(selection, "pause GPUs" if pause else "resume GPUs",
+            applyPause,
+            verifyPause,
+            rollbackPause,
+            describePause)
 
     elif command == "pools":
         loadConfig(configFile)
-        connectMiners(sys.argv[2] if len(sys.argv) >= 3 else "all")
+        selection = ethminerSelection(connectMiners(argv[2] if len(argv) >= 3 else "all"))
 
-        for minerName in miners:
-            miner = miners[minerName]
-            if not miner["api"] or miner["api_type"] != "ethminer":
+        for minerName, (result, error) in forEachMiner(listPools, selection).items():
+            if error or result is None:
+                print("Failed to get pools for miner {}: {}".format(minerName, error))
                 continue
 
-            pools, activePool = listPools(miner)
-            if pools is None:
-                print("Failed to get pools")
-                sys.exit(1)
+            pools, activePool = result
             print("-- Miner {} --".format(minerName))
             printPools(pools, activePool)
 
     elif command == "pool":
-        if len(sys.argv) < 3:
-            print("Usage: {} {} [miner (default: all)] <pool index>".format(sys.argv[0], command))
+        if len(argv) < 3:
+            print("Usage: {} {} [miner (default: all)] <pool index>".format(argv[0], command))
             sys.exit(1)
 
         selectedMiner = None
         selectedPool = None
-        if len(sys.argv) >= 4:
-            selectedMiner = sys.argv[2]
-            selectedPool = int(sys.argv[3])
+        if len(argv) >= 4:
+            selectedMiner = argv[2]
+            selectedPool = int(argv[3])
         else:
             selectedMiner = "all"
-            selectedPool = int(sys.argv[2])
+            selectedPool = int(argv[2])
 
         loadConfig(configFile)
-        connectMiners(selectedMiner)
-
-        for minerName in miners:
-            miner = miners[minerName]
-            if not miner["api"] or miner["api_type"] != "ethminer":
-                continue
 
+        # Returns (pools, previously active pool index), None if the pool index is out of range for the miner
+        def selectPool(miner):
             pools, activePool = listPools(miner)
             if selectedPool > (len(pools) - 1):
-                print("Pool index {} out of range 0-{} for miner {}, skipping".format(selectedPool, len(pools) - 1, minerName))
-                continue
+                return (pools, None)
 
             miner["api"].setActivePool(selectedPool)
-            print("Selected pool {} on miner {}".format(pools[selectedPool], minerName))
+            return (pools, activePool)
+
+        def verifyPool(miner):
+            pools, activePool = listPools(miner)
+            if selectedPool < len(pools) and activePool != selectedPool:
+                raise RuntimeError("active pool is {}".format(activePool))
+            if rolloutOptions.get("--settle", 0) > 0:
+                verifyHashrate(miner, -1, True)
+
+        def restorePool(miner, state):
+            pools, previousPool = state
+            if previousPool is not None and previousPool != selectedPool:
+                miner["api"].setActivePool(previousPool)
+
+        def describePool(minerName, result):
+            pools, previousPool = result
+            if selectedPool > (len(pools) - 1):
+                return "Pool index {} out of range 0-{} for miner {}, skipping".format(selectedPool, len(pools) - 1, minerName)
+            return "Selected pool {} on miner {}".format(pools[selectedPool], minerName)
+
+        selection = ethminerSelection(connectMiners(selectedMiner))
+
+        runRollout(selection, "select pool", selectPool, verifyPool, restorePool, describePool)
 
     elif command == "lhr":
         minerSelection = "all"
         gpuIndex = -1
-        if len(sys.argv) >= 5:
-            minerSelection = sys.argv[2]
-            gpuIndex = int(sys.argv[3])
-            tune = int(sys.argv[4])
-        elif len(sys.argv) >= 4:
-            minerSelection = sys.argv[2]
-            tune = int(sys.argv[3])
-        elif len(sys.argv) >= 3:
-            tune = int(sys.argv[2])
+        if len(argv) >= 5:
+            minerSelection = argv[2]
+            gpuIndex = int(argv[3])
+            tune = int(argv[4])
+        elif len(argv) >= 4:
+            minerSelection = argv[2]
+            tune = int(argv[3])
+        elif len(argv) >= 3:
+            tune = int(argv[2])
         else:
             print("Missing argument \"tune\"")
             sys.exit(1)
 
         loadConfig(configFile)
-        connectMiners(minerSelection)
+        selection = ethminerSelection(connectMiners(minerSelection))
 
-        for minerName in miners:
-            miner = miners[minerName]
-            if not miner["api"] or miner["api_type"] != "ethminer":
-                continue
+        def verifyTune(miner):
+            if rolloutOptions.get("--settle", 0) > 0:
+                verifyHashrate(miner, gpuIndex, True)
+            else:
+                miner["api"].ping()
 
-            miner["api"].setLhrTune(gpuIndex, tune)
+        def describeTune(minerName, result):
             if gpuIndex == -1:
-                print("LHR tune set to {} for all GPUs on miner {}".format(tune, minerName))
+                return "LHR tune set to {} for all GPUs on miner {}".format(tune, minerName)
+            return "LHR tune set to {} for GPU {} on miner {}".format(tune, gpuIndex, minerName)
+
+        # ethminer doesn't report the current LHR tune so there is nothing to roll back to
+        runRollout(selection, "set LHR tune", lambda miner: miner["api"].setLhrTune(gpuIndex, tune), verifyTune, None, describeTune)
+
+    elif command == "detail":
+        initColors()
+        diffInterval = None
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            if flag == "--diff":
+                diffInterval = float(value) if value else 5
+            else:
+                args.append(arg)
+
+        loadConfig(configFile)
+        selection = ethminerSelection(connectMiners(args[2] if len(args) >= 3 else "all"))
+
+        if diffInterval is not None:
+            diffDetailedStats(selection, diffInterval)
+            return
+
+        for minerName, (stats, error) in forEachMiner(lambda miner: miner["api"].getDetailedStats(), selection).items():
+            if error:
+                print("Failed to get detailed statistics of miner {}: {}".format(minerName, error))
+                continue
+
+            print("-- Miner {} --".format(minerName))
+            print(formatDetailedStats(stats))
+
+    elif command == "feed":
+        from pyethminer.changefeed import parseThreshold
+
+        socketPath = None
+        thresholds = []
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            if flag == "--socket":
+                socketPath = value
+            elif flag == "--threshold":
+                try:
+                    thresholds.append(parseThreshold(value))
+                except ValueError as e:
+                    print(e)
+                    sys.exit(1)
+            else:
+                args.append(arg)
+
+        loadConfig(configFile)
+        selection = connectMiners(args[2] if len(args) >= 3 else "all")
+
+        streamChanges(selection, float(args[3]) if len(args) >= 4 else 5, thresholds, socketPath)
+
+    elif command == "record":
+        directory = None
+        rotateSeconds = 86400
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            try:
+                if flag == "--dir":
+                    directory = value
+                elif flag == "--rotate":
+                    rotateSeconds = float(value)
+                    if rotateSeconds <= 0:
+                        raise ValueError("must be positive")
+                else:
+                    args.append(arg)
+            except ValueError as e:
+                print("Invalid {}: {}".format(flag, e))
+                sys.exit(1)
+
+        loadConfig(configFile)
+        selection = connectMiners(args[2] if len(args) >= 3 else "all")
+
+        recordMiners(selection, float(args[3]) if len(args) >= 4 else 10, directory, rotateSeconds)
+
+    elif command == "replay":
+        from pyethminer.changefeed import parseThreshold
+
+        start = None
+        end = None
+        directory = None
+        mode = None
+        thresholds = []
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            try:
+                if flag == "--from":
+                    start = parseTime(value)
+                elif flag == "--to":
+                    end = parseTime(value)
+                elif flag == "--threshold":
+                    thresholds.append(parseThreshold(value))
+                elif flag == "--dir":
+                    directory = value
+                elif flag in ("--feed", "--anomalies"):
+                    mode = flag[2:]
+                else:
+                    args.append(arg)
+            except ValueError as e:
+                print("Invalid {}: {}".format(flag, e))
+                sys.exit(1)
+
+        minerNames = None
+        if len(args) >= 3 and args[2] != "all":
+            # Recorded miners may no longer be in the configuration, fall back to taking the selection as a name
+            minerNames = {args[2]}
+            if os.path.isfile(configFile):
+                loadConfig(configFile)
+                minerNames |= set(selectMiners(args[2]))
+
+        replayRecords(minerNames, start, end, directory, mode, thresholds)
+
+    elif command == "lhrtune":
+        options = {"--low": 50, "--high": 90, "--step": 8, "--samples": 5, "--sample-interval": 10.0}
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            if flag in options:
+                try:
+                    options[flag] = type(options[flag])(value)
+                except ValueError:
+                    print("Invalid value for {}: {}".format(flag, value))
+                    sys.exit(1)
+            else:
+                args.append(arg)
+
+        loadConfig(configFile)
+        selection = ethminerSelection(connectMiners(args[2] if len(args) >= 3 else "all"))
+
+        tuneLhrMiners(selection, int(args[3]) if len(args) >= 4 else -1, options["--low"], options["--high"], options["--step"], rolloutOptions.get("--settle", 60), options["--samples"], options["--sample-interval"])
+
+    elif command == "lhrapply":
+        from pyethminer.lhrtune import TuneStore
+
+        loadConfig(configFile)
+        selection = ethminerSelection(connectMiners(argv[2] if len(argv) >= 3 else "all"))
+        store = TuneStore()
+
+        def applySavedTunes(miner):
+            applied = []
+            for i, key in enumerate(identifyGpus(miner)):
+                saved = store.get(key)
+                if saved:
+                    miner["api"].setLhrTune(i, saved["tune"])
+                    applied.append((i, saved["tune"]))
+            return applied
+
+        for minerName, (result, error) in forEachMiner(applySavedTunes, selection).items():
+            if error:
+                print("Failed to apply LHR tunes on miner {}: {}".format(minerName, error))
+            elif not result:
+                print("No saved LHR tunes for miner {}".format(minerName))
+            else:
+                print("Applied LHR tunes on miner {}: {}".format(minerName, ", ".join("GPU {} = {}".format(i, tune) for i, tune in result)))
+
+    elif command == "watch":
+        loadConfig(configFile)
+        selection = connectMiners(argv[2] if len(argv) >= 3 else "all")
+
+        watchMiners(selection, float(argv[3]) if len(argv) >= 4 else 5)
+
+    elif command == "failover":
+        dryRun = "--dry-run" in argv
+        argv = [arg for arg in argv if arg != "--dry-run"]
+
+        loadConfig(configFile)
+        selection = ethminerSelection(connectMiners(argv[2] if len(argv) >= 3 else "all"))
+
+        failoverMiners(selection, float(argv[3]) if len(argv) >= 4 else 30, dryRun)
+
+    elif command == "guard":
+        action = "report"
+        pauseTime = 60
+        args = []
+        for arg in argv:
+            flag, _, value = arg.partition("=")
+            if flag == "--action":
+                if value not in ("report", "pause", "restart"):
+                    print("Invalid remediation action: {}".format(value))
+                    sys.exit(1)
+                action = value
+            elif flag == "--pause-time":
+                pauseTime = float(value)
             else:
-                print("LHR tune set to {} for GPU {} on miner {}".format(tune, gpuIndex, minerName))
+                args.append(arg)
+
+        loadConfig(configFile)
+        selection = connectMiners(args[2] if len(args) >= 3 else "all")
+
+        guardMiners(selection, float(args[3]) if len(args) >= 4 else 10, action, pauseTime)
+
+    elif command == "exporter":
+        from pyethminer.exporter import MetricsExporter
+
+        host, _, port = (argv[2] if len(argv) >= 3 else ":9910").rpartition(":")
+
+        loadConfig(configFile)
+        keepConnections = True
+        selection = connectMiners("all")
+
+        interval = float(argv[3]) if len(argv) >= 4 else 15
+        scheduler = createScheduler(selection, interval)
+
+        exporter = MetricsExporter(lambda: pollFleet(selection, scheduler), interval, lambda: scheduler.nextDeadline(selection))
+        exporter.serve(host, int(port))
 
     else:
         print("Unknown command: {}".format(command))
         sys.exit(1)
 
+# Hands the command to minectld when it's running so miner connections are reused, otherwise runs it here
+def main():
+    longRunning = ("watch", "exporter", "failover", "guard", "lhrtune", "feed", "record")
+    if len(sys.argv) >= 2 and sys.argv[1] not in ("help", "confighelp", "replay") + longRunning and not any(arg.startswith("--diff") for arg in sys.argv):
+        try:
+            output, exitCode = sendDaemonCommand(sys.argv)
+        except (TimeoutError, ConnectionRefusedError) as e:
+            print("minectld at {} is not responding ({}), running the command without it".format(daemonSocket, e), file=sys.stderr)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        except (OSError, ValueError):
+            pass
+        else:
+            print(output, end="")
+            sys.exit(exitCode)
+
+    runCommand(sys.argv)
+
+# minectld runs one command at a time and acknowledges each before running it. A daemon that doesn't get to the command
+# within daemonTimeout raises TimeoutError so it can be run here instead, one that stops while running it raises
+# RuntimeError since the command may have been carried out.
+def sendDaemonCommand(argv):
+    import socket
+    import json
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(daemonTimeout)
+        stream = sock.makefile("rb")
+        try:
+            sock.connect(daemonSocket)
+            sock.sendall(json.dumps({"argv": argv}).encode("utf-8") + b"\n")
+            response = json.loads(stream.readline())
+        except socket.timeout:
+            raise TimeoutError("no response within {}s".format(daemonTimeout))
+
+        if response.get("started"):
+            # The command is running now, it takes as long as the miners take
+            sock.settimeout(None)
+            try:
+                response = json.loads(stream.readline())
+            except (OSError, ValueError) as e:
+                raise RuntimeError("minectld stopped while running the command: {}".format(e))
+
+    return (response["output"], response["exitCode"])
+
 if __name__ == "__main__":
     main()
     sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,107 @@
+# minectl daemon, keeps connections to every miner open and runs minectl commands sent over a Unix socket
+# Author: Ziah Jyothi
+
+import sys
+import os
+import io
+import socket
+import json
+import contextlib
+import traceback
+from pyethminer import minectl
+
+configMtime = -1
+
+def reloadConfigIfChanged():
+    global configMtime
+
+    try:
+        mtime = os.stat(minectl.configFile).st_mtime
+    except FileNotFoundError:
+        mtime = None
+
+    if mtime == configMtime:
+        return
+
+    for miner in minectl.miners.values():
+        if miner["api"]:
+            miner["api"].disconnect()
+    minectl.miners.clear()
+
+    minectl.loadConfig(minectl.configFile)
+    configMtime = mtime
+
+    minectl.connectMiners("all")
+
+def runCommand(argv):
+    output = io.StringIO()
+    exitCode = 0
+
+    with contextlib.redirect_stdout(output):
+        try:
+            reloadConfigIfChanged()
+            minectl.runCommand(argv)
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc(file=output)
+            exitCode = 1
+
+    return (output.getvalue(), exitCode)
+
+def handleClient(conn):
+    request = bytearray()
+    while not request.endswith(b"\n"):
+        data = conn.recv(65536)
+        if not data:
+            return
+        request += data
+
+    argv = json.loads(request)["argv"]
+
+    # Clients stop waiting for a busy daemon after a while, the acknowledgement fails to send if this one gave up so
+    # its command isn't run twice
+    conn.sendall(b"{\"started\": true}\n")
+    output, exitCode = runCommand(argv)
+
+    conn.sendall(json.dumps({"output": output, "exitCode": exitCode}).encode("utf-8") + b"\n")
+
+def main():
+    socketPath = sys.argv[1] if len(sys.argv) >= 2 else minectl.daemonSocket
+
+    minectl.keepConnections = True
+    # Set up colorama before stdout gets redirected for the first command
+    minectl.initColors()
+    reloadConfigIfChanged()
+
+    if os.path.exists(socketPath):
+        os.unlink(socketPath)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Create the socket with its final permissions so it is never reachable by others, not even briefly
+    oldUmask = os.umask(0o117)
+    try:
+        server.bind(socketPath)
+    finally:
+        os.umask(oldUmask)
+    server.listen(16)
+
+    print("minectld listening on {} with {} miners".format(socketPath, len(minectl.miners)))
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    handleClient(conn)
+                except (OSError, ValueError, KeyError) as e:
+                    print("Failed to handle client request: {}".format(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(socketPath)
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
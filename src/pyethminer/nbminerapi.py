@@ -1,21 +1,148 @@
 # NBMiner REST API Client Library
 # Author: Ziah Jyothi
 
-import json
+from pyethminer import codec
 import time
-import urllib.request, urllib.parse, urllib.error
+import socket
+import threading
+import http.client
+import urllib.parse
+from pyethminer.stats import MinerStats, DeviceStats
 
 class NBMinerApi:
     API_V1_PATH = "/api/v1"
+    # URL scheme -> (connection class, default port), https needs Python built with ssl
+    connectionClasses = {"http": (http.client.HTTPConnection, 80)}
+    if hasattr(http.client, "HTTPSConnection"):
+        connectionClasses["https"] = (http.client.HTTPSConnection, 443)
 
     def __init__(self):
+        self.timeout = 1
+        self.idleTimeout = 30
         self.url = None
+        self.host = None
+        self.port = None
+        self.connectionClass = http.client.HTTPConnection
+        self.basePath = ""
+        self.connected = False
+        self.idleConnections = []
+        self.poolLock = threading.Lock()
+        self.instrumentation = None
+        self.label = None
+
+    def __del__(self):
+        self.closeIdleConnections()
 
     def connect(self, url="http://localhost:22333"):
+        parsedUrl = urllib.parse.urlsplit(url)
+        if parsedUrl.scheme not in NBMinerApi.connectionClasses:
+            raise RuntimeError("Unsupported NBMiner API URL scheme: {}".format(parsedUrl.scheme))
+
+        self.closeIdleConnections()
+
         self.url = url
+        if self.label is None:
+            self.label = url
+        self.connectionClass, defaultPort = NBMinerApi.connectionClasses[parsedUrl.scheme]
+        self.host = parsedUrl.hostname
+        self.port = parsedUrl.port or defaultPort
+        self.basePath = parsedUrl.path.rstrip("/")
+        self.connected = True
 
     def disconnect(self):
+        self.closeIdleConnections()
         self.url = None
+        self.connected = False
+
+    # HTTP/1.1 connections are kept open and reused between requests, connections idle for longer than idleTimeout are
+    # closed instead of reused since the miner has most likely dropped them
+    def acquireConnection(self):
+        now = time.time()
+
+        with self.poolLock:
+            while self.idleConnections:
+                conn, lastUsed = self.idleConnections.pop()
+                if now - lastUsed < self.idleTimeout:
+                    # The socket keeps the timeout it was opened with, apply the current one
+                    conn.timeout = self.timeout
+                    if conn.sock:
+                        conn.sock.settimeout(self.timeout)
+                    return (conn, True)
+                conn.close()
+
+        return (self.connectionClass(self.host, self.port, timeout=self.timeout), False)
+
+    def releaseConnection(self, conn):
+        with self.poolLock:
+            self.idleConnections.append((conn, time.time()))
+
+    def closeIdleConnections(self):
+        with self.poolLock:
+            for conn, lastUsed in self.idleConnections:
+                conn.close()
+            self.idleConnections = []
+
+    def sendRequest(self, path):
+        if not self.connected:
+            raise RuntimeError("Unable to send request when disconnected")
+
+        instrumentation = self.instrumentation
+
+        while True:
+            conn, reused = self.acquireConnection()
+            try:
+                if instrumentation:
+                    phaseStart = time.perf_counter()
+                    if not reused:
+                        conn.connect()
+                        phaseEnd = time.perf_counter()
+                        instrumentation.record(self.label, "connect", "connect", phaseEnd - phaseStart)
+                        phaseStart = phaseEnd
+
+                conn.request("GET", self.basePath + NBMinerApi.API_V1_PATH + path, headers={"Accept": "application/json"})
+
+                if instrumentation:
+                    phaseEnd = time.perf_counter()
+                    instrumentation.record(self.label, path, "send", phaseEnd - phaseStart)
+                    phaseStart = phaseEnd
+
+                resp = conn.getresponse()
+                body = resp.read()
+
+                if instrumentation:
+                    instrumentation.record(self.label, path, "wait", time.perf_counter() - phaseStart)
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+
+                # A reused connection may have been closed by the miner since the last request, retry on another one
+                if reused and not isinstance(e, socket.timeout):
+                    continue
+                if isinstance(e, http.client.HTTPException):
+                    raise RuntimeError("NBMiner API request failed: {}".format(e))
+                raise
+
+            if resp.status != 200:
+                conn.close()
+                raise RuntimeError("NBMiner API request failed: {} {}".format(resp.status, resp.reason))
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self.releaseConnection(conn)
+
+            if instrumentation:
+                phaseStart = time.perf_counter()
+
+            charset = resp.msg.get_content_charset()
+            if charset is None or charset.lower() in ("utf-8", "utf8"):
+                response = codec.loads(body)
+            else:
+                response = codec.loads(body.decode(charset))
+
+            if instrumentation:
+                instrumentation.record(self.label, path, "parse", time.perf_counter() - phaseStart)
+
+            return response
 
     #def authorize(self, password):
         #response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "api_authorize", "params": { "psw": password }})
@@ -28,40 +155,45 @@ class NBMinerApi:
         #self.handleResponse(response, "Failed to ping", "pong")
 
     def getStats(self):
-        request = urllib.request.Request("{}{}/status".format(self.url, NBMinerApi.API_V1_PATH))
-        resp = urllib.request.urlopen(request, timeout=1)
-        response = json.loads(resp.read().decode(resp.info().get_param('charset') or 'utf-8'))
+        response = self.sendRequest("/status")
+
+        # A status that doesn't have the expected shape is the miner's failure, raised like any other bad response
+        try:
+            return NBMinerApi.parseStats(response)
+        except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+            raise RuntimeError("Invalid NBMiner status: {}".format(repr(e)))
 
-        #gpuHashrates = [float(i["hashrate_raw"]) / 1000000 for i in response["miner"]["devices"]]
+    @staticmethod
+    def parseStats(response):
         devices = []
         for dev in response["miner"]["devices"]:
-            devices.append({
-                "name": dev["info"],
-                "pci_bus_id": dev["pci_bus_id"],
-                "accepted_shares": dev["accepted_shares"],
-                "rejected_shares": dev["rejected_shares"],
-                "invalid_shares": dev["invalid_shares"],
-                "hashrate": float(dev["hashrate_raw"]) / 1000000,
-                "core_clock": dev["core_clock"],
-                "memory_clock": dev["mem_clock"],
-                "core_usage": dev["core_utilization"],
-                "memory_usage": dev["mem_utilization"],
-                "lhr_target": dev["lhr"],
-                "core_temp": dev["temperature"],
-                "mem_temp": dev["memTemperature"],
-                "fan": dev["fan"],
-                "power": dev["power"]
-            })
-
-        return {
-            "version": response["version"],
-            "runtime": int(time.time() - response["start_time"]),
-            "hashrate": float(response["miner"]["total_hashrate_raw"]) / 1000000,
-            "sharesAccepted": response["stratum"]["accepted_shares"],
-            "sharesRejected": response["stratum"]["rejected_shares"],
-            "sharesFailed": response["stratum"]["invalid_shares"],
-            "devices": devices
-        } #, "gpuTempFanSpeed": gpuTempFanSpeed, "activePool": response["result"][7], "poolSwitches": int(status2[1])}
+            devices.append(DeviceStats(
+                name=dev["info"],
+                pci_bus_id=dev["pci_bus_id"],
+                accepted_shares=dev["accepted_shares"],
+                rejected_shares=dev["rejected_shares"],
+                invalid_shares=dev["invalid_shares"],
+                hashrate=float(dev["hashrate_raw"]) / 1000000,
+                core_clock=dev["core_clock"],
+                memory_clock=dev["mem_clock"],
+                core_usage=dev["core_utilization"],
+                memory_usage=dev["mem_utilization"],
+                lhr_target=dev["lhr"],
+                core_temp=dev["temperature"],
+                mem_temp=dev["memTemperature"],
+                fan=dev["fan"],
+                power=dev["power"]
+            ))
+
+        return MinerStats(
+            version=response["version"],
+            runtime=int(time.time() - response["start_time"]),
+            hashrate=float(response["miner"]["total_hashrate_raw"]) / 1000000,
+            sharesAccepted=response["stratum"]["accepted_shares"],
+            sharesRejected=response["stratum"]["rejected_shares"],
+            sharesFailed=response["stratum"]["invalid_shares"],
+            devices=devices
+        )
 
     #def getDetailedStats(self):
         #response = self.sendRequest({"jsonrpc": EthminerApi.jsonApiVersion, "method": "miner_getstatdetail"})
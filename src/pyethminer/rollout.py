@@ -0,0 +1,62 @@
+# Staged rollouts of control commands across a fleet
+# Author: Ziah Jyothi
+
+import time
+
+# Applies a change to waves of waveSize miners (0 for all at once). After each wave the changed miners are verified,
+# settleTime seconds later if set so hashrate has time to recover. Once more than maxFailures miners failed to apply or
+# verify (by default on the first failure, -1 for never) the rollout stops and every miner changed so far is rolled
+# back.
+#
+# forEach(func, names) runs func on each miner and returns {minerName: (result, error)} like minectl.forEachMiner.
+# apply(miner) returns whatever rollback(miner, state) needs to undo it, verify(miner) raises if the change didn't
+# take effect. report(minerName, phase, result, error) is called for every miner in the "apply", "verify" and
+# "rollback" phases.
+class Rollout:
+    def __init__(self, forEach, waveSize = 0, maxFailures = 0, settleTime = 0):
+        self.forEach = forEach
+        self.waveSize = waveSize
+        self.maxFailures = maxFailures
+        self.settleTime = settleTime
+
+    def waves(self, selection):
+        if self.waveSize <= 0:
+            return [selection]
+        return [selection[i:i + self.waveSize] for i in range(0, len(selection), self.waveSize)]
+
+    # Returns (aborted, failures) with failures as {minerName: error}
+    def run(self, selection, apply, verify = None, rollback = None, report = None):
+        report = report or (lambda minerName, phase, result, error: None)
+        undoStates = {}
+        failures = {}
+
+        for wave in self.waves(selection):
+            applied = []
+            for minerName, (result, error) in self.forEach(apply, wave).items():
+                report(minerName, "apply", result, error)
+                if error:
+                    failures[minerName] = error
+                else:
+                    undoStates[minerName] = result
+                    applied.append(minerName)
+
+            if verify and applied:
+                if self.settleTime > 0:
+                    time.sleep(self.settleTime)
+
+                for minerName, (result, error) in self.forEach(verify, applied).items():
+                    report(minerName, "verify", result, error)
+                    if error:
+                        failures[minerName] = error
+
+            if self.maxFailures >= 0 and len(failures) > self.maxFailures:
+                if rollback:
+                    def undo(miner):
+                        return rollback(miner, undoStates[miner["name"]])
+
+                    for minerName, (result, error) in self.forEach(undo, list(undoStates)).items():
+                        report(minerName, "rollback", result, error)
+
+                return (True, failures)
+
+        return (False, failures)
@@ -0,0 +1,88 @@
+# Per-miner poll scheduling for long running collection (minectl watch/exporter)
+# Author: Ziah Jyothi
+
+import time
+
+class MinerPollState:
+    def __init__(self, interval):
+        self.interval = interval
+        self.nextPoll = 0
+        self.failures = 0
+        self.lastSuccess = 0
+        self.srtt = None
+        self.rttvar = 0
+
+# Every miner is polled on its own interval. After failureThreshold failures in a row the miner's circuit opens and
+# it is only retried after an exponentially growing backoff, the retry is a probe (ping before stats) so dead rigs cost
+# one cheap request per backoff instead of a full timeout every cycle. Timeouts follow each miner's smoothed RTT like
+# TCP's retransmission timeout, clamped to [minTimeout, maxTimeout].
+class PollScheduler:
+    def __init__(self, interval = 5, minTimeout = 0.1, maxTimeout = 1, maxBackoff = 300, failureThreshold = 2):
+        self.interval = interval
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.maxBackoff = maxBackoff
+        self.failureThreshold = failureThreshold
+        self.states = {}
+
+    def getState(self, minerName):
+        state = self.states.get(minerName)
+        if state is None:
+            state = MinerPollState(self.interval)
+            self.states[minerName] = state
+        return state
+
+    def setInterval(self, minerName, interval):
+        self.getState(minerName).interval = interval
+
+    # Miners due within a tenth of their interval are polled early so polls coalesce into fewer cycles instead of
+    # drifting apart
+    def due(self, minerNames, now = None):
+        if now is None:
+            now = time.time()
+        due = []
+        for minerName in minerNames:
+            state = self.getState(minerName)
+            if state.nextPoll - state.interval * 0.1 <= now:
+                due.append(minerName)
+        return due
+
+    def nextDeadline(self, minerNames):
+        return min((self.getState(minerName).nextPoll for minerName in minerNames), default=time.time() + self.interval)
+
+    def isOpen(self, minerName):
+        return self.getState(minerName).failures >= self.failureThreshold
+
+    def timeoutFor(self, minerName):
+        state = self.getState(minerName)
+        if state.srtt is None:
+            return self.maxTimeout
+        return max(self.minTimeout, min(self.maxTimeout, state.srtt + 4 * state.rttvar))
+
+    def recordSuccess(self, minerName, rtt, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        if state.srtt is None:
+            state.srtt = rtt
+            state.rttvar = rtt / 2
+        else:
+            state.rttvar = 0.75 * state.rttvar + 0.25 * abs(state.srtt - rtt)
+            state.srtt = 0.875 * state.srtt + 0.125 * rtt
+
+        state.failures = 0
+        state.lastSuccess = now
+        state.nextPoll = now + state.interval
+
+    def recordFailure(self, minerName, now = None):
+        if now is None:
+            now = time.time()
+        state = self.getState(minerName)
+
+        state.failures += 1
+        if state.failures >= self.failureThreshold:
+            backoff = state.interval * 2 ** (state.failures - self.failureThreshold + 1)
+            state.nextPoll = now + min(self.maxBackoff, backoff)
+        else:
+            state.nextPoll = now + state.interval
@@ -0,0 +1,135 @@
+# Miner statistics returned by the API clients
+# Author: Ziah Jyothi
+
+# Fields are slots, unreported fields are None. Reading works like the dicts getStats used to return: stats["hashrate"],
+# stats.get("power"), "power" in stats, keys()/items() only cover fields that were reported.
+class StatsView:
+    __slots__ = ()
+    fields = ()
+
+    def __getitem__(self, key):
+        if key in self.fieldSet:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default = None):
+        if key in self.fieldSet:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [field for field in self.fields if getattr(self, field) is not None]
+
+    def values(self):
+        return [self[field] for field in self.keys()]
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, StatsView):
+            other = other.toDict()
+        return self.toDict() == other
+
+    def toDict(self):
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(field, value) for field, value in self.items()))
+
+class DeviceStats(StatsView):
+    fields = ("name", "pci_bus_id", "accepted_shares", "rejected_shares", "invalid_shares", "hashrate", "core_clock", "memory_clock", "core_usage", "memory_usage", "lhr_target", "core_temp", "mem_temp", "fan", "power", "index", "mode", "paused", "pause_reason", "failed_shares", "last_share_age", "segment")
+    fieldSet = frozenset(fields)
+    __slots__ = fields
+
+    def __init__(self, name = None, pci_bus_id = None, accepted_shares = None, rejected_shares = None, invalid_shares = None, hashrate = None, core_clock = None, memory_clock = None, core_usage = None, memory_usage = None, lhr_target = None, core_temp = None, mem_temp = None, fan = None, power = None, index = None, mode = None, paused = None, pause_reason = None, failed_shares = None, last_share_age = None, segment = None):
+        self.name = name
+        self.pci_bus_id = pci_bus_id
+        self.accepted_shares = accepted_shares
+        self.rejected_shares = rejected_shares
+        self.invalid_shares = invalid_shares
+        self.hashrate = hashrate
+        self.core_clock = core_clock
+        self.memory_clock = memory_clock
+        self.core_usage = core_usage
+        self.memory_usage = memory_usage
+        self.lhr_target = lhr_target
+        self.core_temp = core_temp
+        self.mem_temp = mem_temp
+        self.fan = fan
+        self.power = power
+        self.index = index
+        self.mode = mode
+        self.paused = paused
+        self.pause_reason = pause_reason
+        self.failed_shares = failed_shares
+        self.last_share_age = last_share_age
+        # (start, end) of the device's nonce segment
+        self.segment = segment
+
+class MinerStats(StatsView):
+    fields = ("version", "runtime", "hashrate", "sharesAccepted", "sharesRejected", "sharesFailed", "devices", "activePool", "poolSwitches", "hostname", "connected", "difficulty", "epoch", "lastShareAge")
+    fieldSet = frozenset(fields)
+    __slots__ = fields
+
+    def __init__(self, version = None, runtime = None, hashrate = None, sharesAccepted = None, sharesRejected = None, sharesFailed = None, devices = None, activePool = None, poolSwitches = None, hostname = None, connected = None, difficulty = None, epoch = None, lastShareAge = None):
+        self.version = version
+        self.runtime = runtime
+        self.hashrate = hashrate
+        self.sharesAccepted = sharesAccepted
+        self.sharesRejected = sharesRejected
+        self.sharesFailed = sharesFailed
+        self.devices = devices if devices is not None else []
+        self.activePool = activePool
+        self.poolSwitches = poolSwitches
+        self.hostname = hostname
+        self.connected = connected
+        self.difficulty = difficulty
+        self.epoch = epoch
+        self.lastShareAge = lastShareAge
+
+    def toDict(self):
+        result = StatsView.toDict(self)
+        result["devices"] = [dev.toDict() for dev in self.devices]
+        return result
+
+def diffFields(old, new):
+    changes = {}
+    for field in new.fields:
+        if field == "devices":
+            continue
+        oldValue = getattr(old, field) if old is not None else None
+        newValue = getattr(new, field) if new is not None else None
+        if oldValue != newValue:
+            changes[field] = (oldValue, newValue)
+    return changes
+
+# Fields that changed between two polls of the same miner as {field: (old, new)}, changed devices are under "devices" as
+# {device index: {field: (old, new)}} with None for every old or new value of a device that appeared or disappeared
+def diffStats(old, new):
+    changes = diffFields(old, new)
+
+    deviceChanges = {}
+    for i in range(max(len(old.devices), len(new.devices))):
+        oldDevice = old.devices[i] if i < len(old.devices) else None
+        newDevice = new.devices[i] if i < len(new.devices) else None
+        deviceDiff = diffFields(oldDevice, newDevice) if newDevice is not None else {field: (value, None) for field, value in oldDevice.items()}
+        if deviceDiff:
+            deviceChanges[i] = deviceDiff
+    if deviceChanges:
+        changes["devices"] = deviceChanges
+
+    return changes